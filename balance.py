@@ -0,0 +1,253 @@
+import argparse
+import csv
+import itertools
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import endless_lava as el
+from bench_frames import percentile
+
+TUNABLE = ("PLATFORM_GAP", "COIN_SPAWN_CHANCE", "LAVA_RISE_SPEED",
+           "PLATFORM_OFFSET_MIN", "PLATFORM_OFFSET_MAX")
+DEFAULTS = {name: getattr(el, name) for name in TUNABLE}
+CAUSES = ("lava", "trap", "timeout")
+PERCENTILES = (50, 90)
+RESULT_FIELDS = ("policy", "params", "seed", "score", "coins", "jumps",
+                 "cause", "frames")
+
+
+def key_event(kind, key):
+    return pygame.event.Event(kind, key=key)
+
+
+# меняет направление через 10-60 кадров и иногда прыгает
+class RandomPolicy:
+    def __init__(self, rng):
+        self.rng = rng
+        self.key = None
+        self.hold = 0
+
+    def act(self, game):
+        events = []
+        self.hold -= 1
+        if self.hold <= 0:
+            if self.key is not None:
+                events.append(key_event(pygame.KEYUP, self.key))
+            self.key = self.rng.choice((pygame.K_LEFT, pygame.K_RIGHT, None))
+            self.hold = self.rng.randint(10, 60)
+            if self.key is not None:
+                events.append(key_event(pygame.KEYDOWN, self.key))
+        if self.rng.random() < 0.05:
+            events.append(key_event(pygame.KEYDOWN, pygame.K_UP))
+        return events
+
+
+# бежит к ближайшей платформе выше и прыгает, с запаздыванием на 0-6 кадров
+class ClimberPolicy:
+    def __init__(self, rng):
+        self.rng = rng
+        self.target = None
+        self.key = None
+        self.delay = 0
+
+    def steer(self, key):
+        events = []
+        if key != self.key:
+            if self.key is not None:
+                events.append(key_event(pygame.KEYUP, self.key))
+            if key is not None:
+                events.append(key_event(pygame.KEYDOWN, key))
+            self.key = key
+        return events
+
+    def act(self, game):
+        player = game.player
+        if player.on_ground or self.target is None or not self.target.alive():
+            above = [p for p in game.platforms
+                     if p.rect.top < player.rect.bottom - 20]
+            if not above:
+                return self.steer(None)
+            self.target = max(above, key=lambda p: p.rect.y)
+        target = self.target.rect
+        dx = target.centerx - player.rect.centerx
+        # уже над платформой - не проскакиваем её
+        if (not player.on_ground and player.rect.bottom > target.top and
+                player.rect.right > target.left and
+                player.rect.left < target.right):
+            events = self.steer(None)
+        elif dx > 6:
+            events = self.steer(pygame.K_RIGHT)
+        elif dx < -6:
+            events = self.steer(pygame.K_LEFT)
+        else:
+            events = self.steer(None)
+        if not player.on_ground:
+            return events
+        if self.delay > 0:
+            self.delay -= 1
+            return events
+        ground = player.current_platform
+        if abs(dx) < 200 or ground is None or not (
+                ground.rect.left + 8 < player.rect.centerx < ground.rect.right - 8):
+            events.append(key_event(pygame.KEYDOWN, pygame.K_UP))
+            self.delay = self.rng.randint(0, 6)
+        return events
+
+
+POLICIES = {"random": RandomPolicy, "climber": ClimberPolicy}
+
+
+def apply_params(params):
+    # процесс пула выполняет много забегов, поэтому незаданные параметры
+    # возвращаем к исходным
+    for name, value in DEFAULTS.items():
+        setattr(el, name, params.get(name, value))
+
+
+def run_one(task):
+    policy_name, params, seed, max_frames = task
+    apply_params(params)
+    game = el.Game(headless=True, seed=seed, render=False)
+    policy = POLICIES[policy_name](random.Random(seed))
+    frames = 0
+    try:
+        game.state = "RUNNING"
+        while frames < max_frames and game.state == "RUNNING":
+            for event in policy.act(game):
+                game.handle_event(event)
+            game.simulate(el.SIM_STEP)
+            frames += 1
+    finally:
+        game.generator.close()
+        game.scores.close()
+    player = game.player
+    return {"policy": policy_name, "params": params, "seed": seed,
+            "score": player.score, "coins": player.coins,
+            "jumps": player.total_jumps,
+            "cause": player.death_cause or "timeout", "frames": frames}
+
+
+def parse_value(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_sweep(parser, items):
+    sweep = []
+    for item in items:
+        name, _, values = item.partition("=")
+        if name not in TUNABLE or not values:
+            parser.error(f"ожидается ИМЯ=знач1,знач2,... где ИМЯ одно из: "
+                         f"{', '.join(TUNABLE)}")
+        try:
+            sweep.append([(name, parse_value(v)) for v in values.split(",")])
+        except ValueError:
+            parser.error(f"не число в '{item}'")
+    return [dict(combo) for combo in itertools.product(*sweep)]
+
+
+def make_tasks(policies, grid, seeds, max_frames):
+    return [(policy, params, seed, max_frames)
+            for policy in policies for params in grid for seed in seeds]
+
+
+def run_tasks(tasks, jobs):
+    if jobs == 1:
+        return [run_one(task) for task in tasks]
+    # крупные порции - меньше пересылок между процессами
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(run_one, tasks, chunksize=chunksize))
+
+
+def format_params(params):
+    return " ".join(f"{k}={v}" for k, v in params.items()) or "исходные"
+
+
+def summarize(results):
+    groups = {}
+    for r in results:
+        key = (r["policy"], format_params(r["params"]))
+        groups.setdefault(key, []).append(r)
+    rows = []
+    for (policy, params), runs in groups.items():
+        scores = sorted(r["score"] for r in runs)
+        row = {"policy": policy, "params": params, "runs": len(runs),
+               "score_mean": statistics.fmean(scores),
+               "score_max": scores[-1],
+               "coins_mean": statistics.fmean(r["coins"] for r in runs),
+               "jumps_mean": statistics.fmean(r["jumps"] for r in runs)}
+        for p in PERCENTILES:
+            row[f"score_p{p}"] = percentile(scores, p)
+        for cause in CAUSES:
+            row[cause] = sum(r["cause"] == cause for r in runs) / len(runs)
+        rows.append(row)
+    return rows
+
+
+def print_table(rows):
+    print(f"{'политика':<9} {'забегов':>7} {'высота':>8} {'p50':>7} {'p90':>7}"
+          f" {'макс':>7} {'монет':>6} {'прыжков':>8} {'лава':>6}"
+          f" {'ловушка':>8} {'время':>6}  параметры")
+    for r in rows:
+        print(f"{r['policy']:<9} {r['runs']:>7} {r['score_mean']:>8.1f} "
+              f"{r['score_p50']:>7.1f} {r['score_p90']:>7.1f} "
+              f"{r['score_max']:>7.1f} {r['coins_mean']:>6.1f} "
+              f"{r['jumps_mean']:>8.1f} {r['lava']:>6.0%} {r['trap']:>8.0%} "
+              f"{r['timeout']:>6.0%}  {r['params']}")
+
+
+def write_results(path, results):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_FIELDS)
+        for r in results:
+            writer.writerow([format_params(r["params"]) if name == "params"
+                             else r[name] for name in RESULT_FIELDS])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Прогоняет много забегов без отрисовки на всех ядрах и "
+                    "сводит высоту, монеты, прыжки и причины смерти")
+    parser.add_argument("--runs", type=int, default=100,
+                        help="забегов на каждую политику и набор параметров")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="зерно первого забега, дальше подряд")
+    parser.add_argument("--policy", nargs="+", choices=sorted(POLICIES),
+                        default=["climber"])
+    parser.add_argument("--set", dest="sweep", action="append", default=[],
+                        metavar="ИМЯ=ЗНАЧ,...",
+                        help="перебрать значения параметра, например "
+                             "PLATFORM_GAP=90,110,130")
+    parser.add_argument("--max-frames", type=int, default=el.SIM_HZ * 300,
+                        help="предел длины забега в шагах симуляции")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="число процессов (по умолчанию все ядра)")
+    parser.add_argument("-o", "--output", help="сохранить забеги в CSV")
+    args = parser.parse_args()
+    grid = parse_sweep(parser, args.sweep)
+    seeds = range(args.seed, args.seed + args.runs)
+    tasks = make_tasks(args.policy, grid, seeds, args.max_frames)
+    start = time.perf_counter()
+    results = run_tasks(tasks, max(1, args.jobs))
+    elapsed = time.perf_counter() - start
+    if args.output:
+        write_results(args.output, results)
+    print_table(summarize(results))
+    print(f"\n{len(results)} забегов за {elapsed:.1f} с "
+          f"({len(results) / elapsed:.1f} в секунду, процессов: {args.jobs})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import argparse
+import json
+import platform
+import sys
+import time
+
+import pygame
+
+import endless_lava as el
+
+PHASES = [
+    "Player.update",
+    "Game.update_world",
+    "Game.recenter_world",
+    "Game.convert_platforms_below_to_traps",
+    "Game.draw_game",
+    "MiniMap.draw",
+    "MiniMap.refresh",
+]
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples):
+    values = sorted(s * 1e6 for s in samples)
+    result = {"samples": len(values),
+              "mean_us": sum(values) / len(values),
+              "max_us": values[-1]}
+    for p in PERCENTILES:
+        result[f"p{p}_us"] = percentile(values, p)
+    return result
+
+
+class World:
+    def __init__(self, game, size, sparks):
+        self.game = game
+        self.size = size
+        self.sparks = sparks
+        self.rebuild()
+
+    def rebuild(self):
+        saved = el.NUM_PLATFORMS, el.COIN_SPAWN_CHANCE
+        el.NUM_PLATFORMS, el.COIN_SPAWN_CHANCE = self.size, 1.0
+        try:
+            self.game.reset_game(initial=True)
+        finally:
+            el.NUM_PLATFORMS, el.COIN_SPAWN_CHANCE = saved
+        for _ in range(self.sparks):
+            self.game.spawn_spark()
+
+    def platforms_by_height(self):
+        return sorted(self.game.platforms, key=lambda p: -p.rect.y)
+
+    def stand_on(self, pf):
+        player = self.game.player
+        player.rect.bottom = pf.rect.top
+        player.rect.centerx = pf.rect.centerx
+        player.vx = player.vy = 0
+        player.current_platform = pf
+        self.game.camera.update(player)
+        self.game.minimap.update()
+
+    def stand_on_lowest(self):
+        self.stand_on(max(self.game.platforms, key=lambda p: p.rect.y))
+
+    def stand_on_highest(self):
+        self.stand_on(min(self.game.platforms, key=lambda p: p.rect.y))
+
+
+def time_call(setup, call, repeats, warmup):
+    samples = []
+    for i in range(warmup + repeats):
+        setup()
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            samples.append(elapsed)
+    return samples
+
+
+def bench_world(game, size, sparks, repeats, warmup):
+    world = World(game, size, sparks)
+    results = {}
+
+    def update_player():
+        game.player.update(el.SIM_STEP, game)
+
+    results["Player.update"] = time_call(world.stand_on_highest, update_player,
+                                         repeats, warmup)
+    results["Game.update_world"] = time_call(world.stand_on_lowest,
+                                             game.update_world, repeats, warmup)
+
+    def climb_above_recenter_line():
+        # мир сдвигается только за пределом WORLD_REBASE_LIMIT; пересобираем
+        # его, чтобы координаты не уплывали от замера к замеру
+        world.rebuild()
+        world.stand_on_lowest()
+        game.player.rect.y = -el.WORLD_REBASE_LIMIT - 1
+
+    results["Game.recenter_world"] = time_call(climb_above_recenter_line,
+                                               game.recenter_world,
+                                               repeats, warmup)
+
+    landing = {}
+
+    def next_landing():
+        # приземление на следующую платформу делает ловушкой ровно одну
+        rows = world.platforms_by_height()
+        if len(rows) < 2:
+            world.rebuild()
+            rows = world.platforms_by_height()
+        landing["y"] = rows[1].rect.y
+
+    world.rebuild()
+    results["Game.convert_platforms_below_to_traps"] = time_call(
+        next_landing,
+        lambda: game.convert_platforms_below_to_traps(landing["y"]),
+        repeats, warmup)
+    world.rebuild()
+    results["Game.draw_game"] = time_call(world.stand_on_lowest,
+                                          game.draw_game, repeats, warmup)
+    results["MiniMap.draw"] = time_call(world.stand_on_lowest,
+                                        lambda: game.minimap.draw(game.screen),
+                                        repeats, warmup)
+    results["MiniMap.refresh"] = time_call(world.stand_on_lowest,
+                                           game.minimap.refresh,
+                                           repeats, warmup)
+    return [dict(platforms=size, sparks=sparks, phase=phase,
+                 **summarize(results[phase])) for phase in PHASES]
+
+
+def run_suite(sizes, spark_counts, repeats, warmup, seed):
+    game = el.Game(headless=True, seed=seed)
+    game.state = "RUNNING"
+    results = []
+    for size in sizes:
+        for sparks in spark_counts:
+            results.extend(bench_world(game, size, sparks, repeats, warmup))
+    report = {"meta": {"python": sys.version.split()[0],
+                       "pygame": pygame.version.ver,
+                       "machine": platform.machine(),
+                       "seed": seed, "repeats": repeats,
+                       "assets": el.ASSETS.stats(),
+                       "text_cache": game.text_cache.stats()},
+              "results": results}
+    pygame.quit()
+    return report
+
+
+def compare(report, baseline, metric, threshold, min_delta_us):
+    base = {(r["platforms"], r["sparks"], r["phase"]): r
+            for r in baseline["results"]}
+    regressions = []
+    for r in report["results"]:
+        old = base.get((r["platforms"], r["sparks"], r["phase"]))
+        if old is None:
+            continue
+        ratio = r[metric] / max(old[metric], 1e-9)
+        delta = r[metric] - old[metric]
+        r["baseline_" + metric] = old[metric]
+        r["ratio"] = ratio
+        if ratio > 1 + threshold and delta > min_delta_us:
+            regressions.append(r)
+    return regressions
+
+
+def print_table(report, metric):
+    print(f"{'платформ':>9} {'искр':>5}  {'фаза':<40} {metric:>10} {'p99_us':>10}"
+          f" {'к базе':>8}")
+    for r in report["results"]:
+        ratio = f"x{r['ratio']:.2f}" if "ratio" in r else ""
+        print(f"{r['platforms']:>9} {r['sparks']:>5}  {r['phase']:<40} "
+              f"{r[metric]:>10.1f} {r['p99_us']:>10.1f} {ratio:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Замеряет стоимость фаз кадра на синтетических мирах")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[15, 100, 1000, 10000],
+                        help="число платформ (и монет) в мире")
+    parser.add_argument("--sparks", type=int, nargs="+", default=[5, 50],
+                        help="число искр лавы")
+    parser.add_argument("-n", "--repeats", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="сравнить с сохранёнными результатами")
+    parser.add_argument("--metric", default="p50_us",
+                        choices=["mean_us", "max_us"] +
+                                [f"p{p}_us" for p in PERCENTILES])
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="допустимое замедление (0.10 = 10%%)")
+    parser.add_argument("--min-delta", type=float, default=5.0,
+                        help="игнорировать разницу меньше N мкс")
+    args = parser.parse_args()
+    report = run_suite(args.sizes, args.sparks, args.repeats, args.warmup,
+                       args.seed)
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.metric, args.threshold,
+                              args.min_delta)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    print_table(report, args.metric)
+    text = report["meta"]["text_cache"]
+    print(f"\nКэш текста: {text['hit_rate']:.0%} попаданий "
+          f"({text['hits']} из {text['hits'] + text['misses']})")
+    if regressions:
+        print(f"\nРегрессии ({len(regressions)}):")
+        for r in regressions:
+            print(f"  {r['platforms']} платформ, {r['sparks']} искр, "
+                  f"{r['phase']}: {r['baseline_' + args.metric]:.1f} -> "
+                  f"{r[args.metric]:.1f} мкс (x{r['ratio']:.2f})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
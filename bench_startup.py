@@ -0,0 +1,61 @@
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+import endless_lava as el
+
+
+def release_assets():
+    # кэш держит поверхности поверх mmap пакета, поэтому сначала он
+    el.ASSETS.clear()
+    if el.ASSETS.pack is not None:
+        el.ASSETS.pack.close()
+    el.ASSETS.attach_pack(None)
+
+
+def load_assets(use_pack):
+    release_assets()
+    start = time.perf_counter()
+    if use_pack:
+        pack = el.open_asset_pack()
+        if pack is None:
+            raise SystemExit("Пакет ресурсов не найден или устарел, "
+                             "сначала запустите build_assets.py")
+        el.ASSETS.attach_pack(pack)
+    el.ASSETS.preload(el.PRELOAD_IMAGES, el.PACK_FRAMES)
+    return time.perf_counter() - start
+
+
+def measure(use_pack, repeats):
+    samples = [load_assets(use_pack) for _ in range(repeats)]
+    return {"min": min(samples) * 1000,
+            "median": statistics.median(samples) * 1000,
+            "bytes": el.ASSETS.bytes_held()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Сравнивает время загрузки ресурсов из папки data "
+                    "и из пакета")
+    parser.add_argument("-n", "--repeats", type=int, default=10)
+    args = parser.parse_args()
+    pygame.display.init()
+    pygame.display.set_mode((el.SCREEN_WIDTH, el.SCREEN_HEIGHT))
+    results = {"data": measure(False, args.repeats),
+               "pack": measure(True, args.repeats)}
+    release_assets()
+    pygame.quit()
+    for name, r in results.items():
+        print(f"{name:>5}: медиана {r['median']:8.2f} мс, "
+              f"минимум {r['min']:8.2f} мс, {r['bytes'] / 1024:.0f} КиБ")
+    speedup = results["data"]["median"] / max(results["pack"]["median"], 1e-9)
+    print(f"Ускорение: x{speedup:.1f}")
+
+
+if __name__ == "__main__":
+    main()
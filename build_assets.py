@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+import endless_lava as el
+
+
+def packed(surface):
+    # цветовой ключ сохраняем как есть, а не переводим в альфу: блиты с ключом
+    # быстрее, ключ записывается в индекс
+    if surface.get_colorkey() is not None:
+        return surface
+    return surface.convert_alpha()
+
+
+def pack_surface(filename, colorkey, size):
+    surface = el.load_image(filename, colorkey)
+    if size is not None:
+        surface = pygame.transform.scale(surface, size)
+    return packed(surface)
+
+
+def pack_frames(filename, colorkey, columns, size):
+    sheet = el.load_image(filename, colorkey)
+    frame_w = sheet.get_width() // columns
+    for i in range(columns):
+        frame = sheet.subsurface(
+            pygame.Rect(frame_w * i, 0, frame_w, sheet.get_height()))
+        yield i, packed(pygame.transform.scale(frame, size))
+
+
+def collect_entries():
+    for filename, colorkey, size in el.PRELOAD_IMAGES:
+        yield el.pack_key(filename, colorkey, size), \
+            pack_surface(filename, colorkey, size)
+    for filename, colorkey, columns, size in el.PACK_FRAMES:
+        for i, frame in pack_frames(filename, colorkey, columns, size):
+            yield el.pack_key(filename, colorkey, size, i), frame
+
+
+def build_pack(path):
+    entries = {}
+    blobs = []
+    offset = 0
+    for key, surface in collect_entries():
+        data = pygame.image.tobytes(surface, "BGRA")
+        padding = -len(data) % el.PACK_ALIGN
+        entries[key] = [offset, surface.get_width(), surface.get_height(),
+                        surface.get_colorkey()]
+        blobs.append(data + b"\0" * padding)
+        offset += len(data) + padding
+    index = json.dumps({"spec": el.pack_spec(), "sources": el.pack_sources(),
+                        "entries": entries}).encode("utf-8")
+    header = el.PACK_HEADER.pack(el.PACK_MAGIC, el.PACK_VERSION, len(index))
+    head = header + index
+    head += b"\0" * (-len(head) % el.PACK_ALIGN)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(head)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    return len(entries), len(head) + offset
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Собирает ресурсы из папки data в единый пакет с "
+                    "готовыми к выводу пикселями")
+    parser.add_argument("-o", "--output",
+                        default=os.path.join(el.DATA_DIR, el.ASSET_PACK),
+                        help="путь к пакету (по умолчанию data/assets.pack)")
+    args = parser.parse_args()
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    count, size = build_pack(args.output)
+    pygame.quit()
+    print(f"Пакет '{args.output}': {count} записей, {size / 1024:.0f} КиБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
+import argparse
+import atexit
+import csv
+import json
+from collections import OrderedDict, deque
+import mmap
 import os
+import queue
 import random
+import struct
 import sys
+import threading
+import time
 import math
+import zlib
+import numpy as np
 import pygame
 
 FPS = 60
+# физика задана на один шаг симуляции, частота отрисовки от неё не зависит
+SIM_HZ = 60
+SIM_STEP = 1000 / SIM_HZ
+MAX_CATCHUP_STEPS = 5
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 
@@ -26,14 +42,84 @@ LAVA_RISE_SPEED = 2
 PLATFORM_WIDTH = 120
 PLATFORM_HEIGHT = 30
 PLATFORM_GAP = 110
+PLATFORM_OFFSET_MIN = -250
+PLATFORM_OFFSET_MAX = 230
+CHUNK_ROWS = 8
+CHUNKS_AHEAD = 4
 NUM_PLATFORMS = 15
-
-SPARK_GENERATE_INTERVAL = 200
+PLATFORM_POOL_SIZE = 32
+COIN_POOL_SIZE = 16
+CAMERA_TOP_MARGIN = 100
+WORLD_REBASE_LIMIT = 100000
+SPATIAL_BUCKET = 128
+RECT_ARRAY_CAPACITY = 64
+LANDING_TOLERANCE = 5
+NO_SLOTS = np.empty(0, dtype=np.intp)
+
+SPARK_EMISSION_RATE = 5
+SPARK_CAPACITY = 256
+SPARK_FADE = 10
+SPARK_SPEED_X = 3.0
+SPARK_SPEED_Y = (-8.0, -2.0)
+SPARK_ALPHA_LEVELS = 64
 COIN_SPAWN_CHANCE = 0.3
 LAVA_HEIGHT = 50
+COIN_SIZE = (24, 24)
+SPARK_SIZE = (10, 10)
+PLAYER_SIZE = (40, 55)
+MINIMAP_RECT = (10, 400, 150, 150)
+MINIMAP_HZ = 12
 
 FONT_NAME = "Arial"
 FONT_SIZE = 26
+TEXT_CACHE_SIZE = 64
+
+DATA_DIR = "data"
+ASSET_PACK = "assets.pack"
+PACK_MAGIC = b"ELPK"
+PACK_VERSION = 2
+PACK_HEADER = struct.Struct("<4sII")
+PACK_ALIGN = 16
+
+# уровни качества от низкого к высокому: искры (частота в секунду, предел),
+# частота миникарты, сглаживание текста HUD, кадров анимации лавы в секунду
+QUALITY_TIERS = [
+    {"name": "низкое", "spark_rate": 1, "spark_cap": 32, "minimap_hz": 4,
+     "antialias": False, "lava_fps": 4},
+    {"name": "среднее", "spark_rate": 3, "spark_cap": 128, "minimap_hz": 8,
+     "antialias": True, "lava_fps": 6},
+    {"name": "высокое", "spark_rate": SPARK_EMISSION_RATE,
+     "spark_cap": SPARK_CAPACITY, "minimap_hz": MINIMAP_HZ,
+     "antialias": True, "lava_fps": 8},
+]
+GOVERNOR_WINDOW = 90
+GOVERNOR_DOWNGRADE = 0.9
+GOVERNOR_UPGRADE = 0.5
+
+PROFILER_PHASES = ("events", "lava", "sprites", "coins", "recenter", "world",
+                   "minimap", "draw", "flip")
+PROFILER_SAMPLES = 600
+PROFILER_OVERLAY_HZ = 4
+
+SAVE_DIR = "save"
+RUNS_LOG = "runs.{}.log"
+RUNS_SUMMARY = "summary.json"
+# время, счёт, монеты, прыжки, усиление (0 - нет), зерно
+RUN_RECORD = struct.Struct("<dIIIBq")
+STORE_CHECKPOINT_EVERY = 50
+STORE_SEGMENT_RUNS = 1000
+STORE_CLOSE_TIMEOUT = 2.0
+STORE_READ_CHUNK = 4096
+
+REPLAY_MAGIC = b"ELRP"
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct("<4sIq")
+REPLAY_RECORD = struct.Struct("<IBI")
+REPLAY_KEYDOWN = 1
+REPLAY_KEYUP = 2
+REPLAY_BUY = 3
+REPLAY_RESTART = 4
+REPLAY_END = 5
 
 START_FON = "fon.png"
 HELP_FON = "help_fon.jpg"
@@ -55,17 +141,58 @@ SOUND_COIN = "coin.mp3"
 SOUND_DEATH = "death.wav"
 buy_sound = "buy_sound.wav"
 
+AUDIO_FREQUENCY = 44100
+AUDIO_BUFFER = 512
+# сколько каналов микшера отдано каждой категории звуков
+AUDIO_CATEGORIES = {
+    "player": 2,
+    "pickup": 2,
+    "ui": 1,
+}
+AUDIO_EFFECTS = {
+    "jump": (SOUND_JUMP, "player"),
+    "coin": (SOUND_COIN, "pickup"),
+    "death": (SOUND_DEATH, "ui"),
+    "buy": (buy_sound, "ui"),
+}
+
 POWERUP_TRANSLATIONS = {
     "double_jump": "двойной прыжок",
     "triple_jump": "тройной прыжок",
     "quadruple_jump": "четверной прыжок"
 }
+POWERUP_PRICES = {
+    "double_jump": 3,
+    "triple_jump": 5,
+    "quadruple_jump": 7
+}
 
 GAME_TITLE = "Endless Lava Escape"
 
+PRELOAD_IMAGES = [
+    (PLATFORM_IMG, -1, (PLATFORM_WIDTH, PLATFORM_HEIGHT)),
+    (PLATFORM_TRAP_IMG, -1, (PLATFORM_WIDTH, PLATFORM_HEIGHT)),
+    (COIN_IMG, -1, COIN_SIZE),
+    (SPARK_IMG, -1, SPARK_SIZE),
+    (LAVA_SHEET_IMG, -1, None),
+    (PLAYER_STAND_IMG, -1, PLAYER_SIZE),
+    (PLAYER_JUMP_IMG, -1, PLAYER_SIZE),
+    (MINIMAP_FRAME, None, MINIMAP_RECT[2:]),
+    (START_FON, None, (SCREEN_WIDTH, SCREEN_HEIGHT)),
+    (HELP_FON, None, (SCREEN_WIDTH, SCREEN_HEIGHT)),
+    (PAUSE_FON, None, (SCREEN_WIDTH, SCREEN_HEIGHT)),
+    (SHOP_FON, None, (SCREEN_WIDTH, SCREEN_HEIGHT)),
+]
+
+PACK_FRAMES = [
+    (LAVA_SHEET_IMG, -1, 8, (SCREEN_WIDTH, LAVA_HEIGHT)),
+]
+# сколько меню ждёт ввода, прежде чем догрузить следующий кусок игры
+LOADING_POLL_MS = 10
+
 
 def load_image(filename, colorkey=None):
-    fullname = os.path.join("data", filename)
+    fullname = os.path.join(DATA_DIR, filename)
     if not os.path.isfile(fullname):
         print(f"Файл '{fullname}' не найден в папке data")
         sys.exit(1)
@@ -81,13 +208,276 @@ def load_image(filename, colorkey=None):
 
 
 def load_sound(filename):
-    fullname = os.path.join("data", filename)
+    fullname = os.path.join(DATA_DIR, filename)
     if not os.path.isfile(fullname):
         print(f"Звуковой файл '{fullname}' не найден. Звук отключён.")
         return None
     return pygame.mixer.Sound(fullname)
 
 
+# звуки грузятся раз на процесс, у каждой категории свои каналы
+class AudioManager:
+    def __init__(self):
+        self.sounds = {}
+        self.channels = {}
+
+    def init(self, effects=AUDIO_EFFECTS, categories=AUDIO_CATEGORIES):
+        if pygame.mixer.get_init() is None:
+            return
+        # каналы раздаём при каждой инициализации микшера, звуки - однажды
+        total = sum(categories.values())
+        pygame.mixer.set_num_channels(max(total, 8))
+        # зарезервированные каналы не достанутся Sound.play() без канала
+        pygame.mixer.set_reserved(total)
+        index = 0
+        for category, count in categories.items():
+            self.channels[category] = deque(
+                pygame.mixer.Channel(index + i) for i in range(count))
+            index += count
+        for name, (filename, category) in effects.items():
+            if name not in self.sounds:
+                self.sounds[name] = (load_sound(filename), category)
+
+    def play(self, name):
+        sound, category = self.sounds.get(name, (None, None))
+        if sound is None:
+            return
+        channels = self.channels[category]
+        for channel in channels:
+            if not channel.get_busy():
+                break
+        else:
+            channel = channels[0]
+        channels.remove(channel)
+        channels.append(channel)
+        channel.play(sound)
+
+
+AUDIO = AudioManager()
+
+
+def pack_key(filename, colorkey, size, frame=None):
+    size_part = f"{size[0]}x{size[1]}" if size is not None else "orig"
+    key = f"{filename}:{colorkey}:{size_part}"
+    if frame is not None:
+        key += f":{frame}"
+    return key
+
+
+def pack_spec():
+    return zlib.crc32(repr((PACK_VERSION, PRELOAD_IMAGES,
+                            PACK_FRAMES)).encode("utf-8"))
+
+
+def pack_sources():
+    names = sorted({entry[0] for entry in PRELOAD_IMAGES + PACK_FRAMES})
+    sources = {}
+    for name in names:
+        fullname = os.path.join(DATA_DIR, name)
+        if os.path.isfile(fullname):
+            st = os.stat(fullname)
+            sources[name] = [st.st_mtime_ns, st.st_size]
+        else:
+            sources[name] = None
+    return sources
+
+
+class AssetPack:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            # ACCESS_COPY: страницы общие с кэшем ОС, пока в них не пишут
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        self.view = memoryview(self.mmap)
+        magic, self.version, index_len = PACK_HEADER.unpack_from(self.mmap, 0)
+        if magic != PACK_MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' не является пакетом ресурсов")
+        index_end = PACK_HEADER.size + index_len
+        index = json.loads(bytes(self.view[PACK_HEADER.size:index_end]))
+        self.data_start = -(-index_end // PACK_ALIGN) * PACK_ALIGN
+        self.spec = index["spec"]
+        self.sources = index["sources"]
+        self.entries = index["entries"]
+
+    def is_stale(self):
+        return (self.version != PACK_VERSION or self.spec != pack_spec() or
+                self.sources != pack_sources())
+
+    def surface(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        offset, w, h, colorkey = entry
+        start = self.data_start + offset
+        surface = pygame.image.frombuffer(self.view[start:start + w * h * 4],
+                                          (w, h), "BGRA")
+        if colorkey is not None:
+            # как в load_image: без альфы, с ключом и RLE, такие блиты быстрее
+            surface = surface.convert()
+            surface.set_colorkey(colorkey, pygame.RLEACCEL)
+        return surface
+
+    def close(self):
+        self.view.release()
+        self.mmap.close()
+
+
+def open_asset_pack(path=None):
+    if path is None:
+        path = os.path.join(DATA_DIR, ASSET_PACK)
+    if not os.path.isfile(path):
+        return None
+    try:
+        pack = AssetPack(path)
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"Пакет ресурсов '{path}' повреждён ({e}), загрузка из папки data")
+        return None
+    if pack.is_stale():
+        print(f"Пакет ресурсов '{path}' устарел, загрузка из папки data")
+        pack.close()
+        return None
+    return pack
+
+
+class AssetCache:
+    def __init__(self):
+        self.surfaces = {}
+        self.frame_sets = {}
+        self.pack = None
+        # пакет ищем один раз на процесс
+        self.pack_checked = False
+        self.hits = 0
+        self.misses = 0
+        self.pack_loads = 0
+
+    def attach_pack(self, pack):
+        self.pack = pack
+        self.pack_checked = True
+
+    def load(self, filename, colorkey, size, frame=None):
+        if self.pack is not None:
+            surface = self.pack.surface(pack_key(filename, colorkey, size, frame))
+            if surface is not None:
+                self.pack_loads += 1
+                return surface
+        surface = load_image(filename, colorkey)
+        if size is not None:
+            surface = pygame.transform.scale(surface, size)
+        return surface
+
+    def image(self, filename, colorkey=None, size=None):
+        key = (filename, colorkey, size)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = self.load(filename, colorkey, size)
+        self.surfaces[key] = surface
+        return surface
+
+    def frames(self, filename, colorkey, columns, size):
+        key = (filename, colorkey, columns, size)
+        frames = self.frame_sets.get(key)
+        if frames is not None:
+            self.hits += 1
+            return frames
+        self.misses += 1
+        frames = []
+        for i in range(columns):
+            frame = None
+            if self.pack is not None:
+                frame = self.pack.surface(pack_key(filename, colorkey, size, i))
+            if frame is None:
+                sheet = self.image(filename, colorkey)
+                frame_w = sheet.get_width() // columns
+                frame = pygame.transform.scale(sheet.subsurface(
+                    pygame.Rect(frame_w * i, 0, frame_w, sheet.get_height())), size)
+            else:
+                self.pack_loads += 1
+            frames.append(frame)
+        self.frame_sets[key] = frames
+        return frames
+
+    def preload(self, entries, frame_entries=()):
+        for filename, colorkey, size in entries:
+            self.image(filename, colorkey, size)
+        for filename, colorkey, columns, size in frame_entries:
+            self.frames(filename, colorkey, columns, size)
+
+    def bytes_held(self):
+        surfaces = list(self.surfaces.values())
+        for frames in self.frame_sets.values():
+            surfaces.extend(frames)
+        return sum(s.get_pitch() * s.get_height() for s in surfaces)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "pack_loads": self.pack_loads,
+                "entries": len(self.surfaces) + len(self.frame_sets),
+                "bytes": self.bytes_held()}
+
+    def clear(self):
+        self.surfaces.clear()
+        self.frame_sets.clear()
+        self.hits = 0
+        self.misses = 0
+        self.pack_loads = 0
+
+
+ASSETS = AssetCache()
+
+
+# отрисованные строки, давно не использованные вытесняются
+class TextCache:
+    def __init__(self, capacity=TEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, color, antialias)
+        image = self.entries.get(key)
+        if image is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return image
+        self.misses += 1
+        image = font.render(text, antialias, color)
+        self.entries[key] = image
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return image
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(self.entries), "hit_rate": self.hit_rate()}
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def merge_rects(rects):
+    merged = []
+    for rect in rects:
+        if rect.width <= 0 or rect.height <= 0:
+            continue
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect = rect.union(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+
 class AnimatedSprite(pygame.sprite.Sprite):
     def __init__(self, sheet, columns, rows, x=0, y=0, fps=10, *groups):
         super().__init__(*groups)
@@ -122,25 +512,241 @@ class Camera:
         self.height = height
         self.dx = 0
         self.dy = 0
+        self.scroll_y = 0
 
     def update(self, target):
         center_y = SCREEN_HEIGHT // 2
         self.dy = -(target.rect.y - center_y)
         self.dx = 0
+        # насколько мир прокрутился вверх вслед за самой высокой точкой игрока
+        self.scroll_y = min(self.scroll_y, target.rect.y - CAMERA_TOP_MARGIN)
+
+    def view_y(self, y):
+        return y - self.scroll_y
+
+    def rebase(self, dy):
+        self.dy -= dy
+        self.scroll_y += dy
+
+
+# спрайты разложены по корзинам по вертикали для выборки по высоте
+class SpatialGroup(pygame.sprite.Group):
+    def __init__(self, *sprites, bucket_size=SPATIAL_BUCKET):
+        self.bucket_size = bucket_size
+        self.buckets = {}
+        self.bucket_of = {}
+        self.origin_y = 0
+        self.max_height = 0
+        super().__init__(*sprites)
+
+    def bucket_key(self, y):
+        return (y - self.origin_y) // self.bucket_size
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        key = self.bucket_key(sprite.rect.y)
+        self.buckets.setdefault(key, {})[sprite] = None
+        self.bucket_of[sprite] = key
+        if sprite.rect.height > self.max_height:
+            self.max_height = sprite.rect.height
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        key = self.bucket_of.pop(sprite)
+        bucket = self.buckets[key]
+        del bucket[sprite]
+        if not bucket:
+            del self.buckets[key]
+
+    def rebase(self, dy):
+        # все спрайты группы уже сдвинуты на dy, ключи корзин не меняются
+        self.origin_y += dy
+
+    def query(self, top, bottom):
+        found = []
+        buckets = self.buckets
+        for key in range(self.bucket_key(top - self.max_height),
+                         self.bucket_key(bottom) + 1):
+            bucket = buckets.get(key)
+            if bucket:
+                for sprite in bucket:
+                    if sprite.rect.bottom > top and sprite.rect.top < bottom:
+                        found.append(sprite)
+        return found
+
+
+# прямоугольники для столкновений в NumPy, y растёт вместе с индексом
+class RectArrays:
+    def __init__(self, capacity=RECT_ARRAY_CAPACITY):
+        self.allocate(capacity)
+        self.start = self.end = capacity
+        self.max_h = 0
+
+    def allocate(self, capacity):
+        self.x = np.zeros(capacity, dtype=np.int64)
+        self.y = np.zeros(capacity, dtype=np.int64)
+        self.w = np.zeros(capacity, dtype=np.int64)
+        self.h = np.zeros(capacity, dtype=np.int64)
+        self.is_trap = np.zeros(capacity, dtype=bool)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.sprites = [None] * capacity
+
+    def make_room(self):
+        # живой диапазон переезжает в конец массивов, при тесноте вдвое больших
+        old = (self.x, self.y, self.w, self.h, self.is_trap, self.alive)
+        old_sprites = self.sprites
+        live = self.end - self.start
+        capacity = len(self.alive)
+        if live * 2 > capacity:
+            capacity *= 2
+        self.allocate(capacity)
+        start = capacity - live
+        for new, array in zip((self.x, self.y, self.w, self.h, self.is_trap,
+                               self.alive), old):
+            new[start:] = array[self.start:self.end]
+        self.sprites[start:] = old_sprites[self.start:self.end]
+        for i, sprite in enumerate(self.sprites[start:], start):
+            if sprite is not None:
+                sprite.slot = i
+        self.start, self.end = start, capacity
+
+    def add(self, sprite):
+        if self.start == 0:
+            self.make_room()
+        self.start -= 1
+        slot = self.start
+        rect = sprite.rect
+        self.x[slot] = rect.x
+        self.y[slot] = rect.y
+        self.w[slot] = rect.width
+        self.h[slot] = rect.height
+        self.is_trap[slot] = False
+        self.alive[slot] = True
+        self.sprites[slot] = sprite
+        self.max_h = max(self.max_h, rect.height)
+        sprite.slot = slot
+
+    def remove(self, sprite):
+        slot = sprite.slot
+        self.alive[slot] = False
+        self.sprites[slot] = None
+        sprite.slot = None
+        while self.end > self.start and not self.alive[self.end - 1]:
+            self.end -= 1
+        while self.start < self.end and not self.alive[self.start]:
+            self.start += 1
+
+    def set_trap(self, sprite):
+        self.is_trap[sprite.slot] = True
+
+    def rebase(self, dy):
+        self.y[self.start:self.end] += dy
+
+    def window(self, low, high):
+        # индексы записей с low <= y < high
+        y = self.y[self.start:self.end]
+        return (self.start + int(y.searchsorted(low)),
+                self.start + int(y.searchsorted(high)))
+
+    def colliding(self, rect, is_trap=None):
+        lo, hi = self.window(rect.top - self.max_h + 1, rect.bottom)
+        if lo >= hi:
+            return NO_SLOTS
+        x = self.x[lo:hi]
+        mask = (self.alive[lo:hi] & (x < rect.right) &
+                (x + self.w[lo:hi] > rect.left) &
+                (self.y[lo:hi] + self.h[lo:hi] > rect.top))
+        if is_trap is not None:
+            mask &= self.is_trap[lo:hi] == is_trap
+        return lo + mask.nonzero()[0]
+
+    def landing(self, rect, tolerance):
+        # ближайшая платформа, верх которой не глубже tolerance под ногами
+        lo, hi = self.window(rect.bottom, rect.bottom + tolerance)
+        if lo >= hi:
+            return None
+        x = self.x[lo:hi]
+        found = (self.alive[lo:hi] & ~self.is_trap[lo:hi] & (x < rect.right) &
+                 (x + self.w[lo:hi] > rect.left)).nonzero()[0]
+        return self.sprites[lo + found[0]] if len(found) else None
+
+
+# ряды платформ снизу вверх, ловушки - нижние trap_rows рядов
+class WorldStream:
+    def __init__(self):
+        self.rows = deque()
+        self.trap_rows = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def push(self, platform):
+        self.rows.append(platform)
+
+    def highest(self):
+        return self.rows[-1] if self.rows else None
+
+    def pop_below(self, y):
+        expired = []
+        rows = self.rows
+        while rows and rows[0].rect.y > y:
+            expired.append(rows.popleft())
+        self.trap_rows = max(0, self.trap_rows - len(expired))
+        return expired
+
+    def mark_traps_below(self, y):
+        marked = []
+        rows = self.rows
+        while self.trap_rows < len(rows) and rows[self.trap_rows].rect.y > y:
+            marked.append(rows[self.trap_rows])
+            self.trap_rows += 1
+        return marked
+
+    def clear(self):
+        self.rows.clear()
+        self.trap_rows = 0
+
+
+# отслужившие спрайты выдаются снова вместо создания новых
+class SpritePool:
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.free = [factory() for _ in range(size)]
+        self.created = size
+
+    def acquire(self, *args):
+        if self.free:
+            sprite = self.free.pop()
+        else:
+            sprite = self.factory()
+            self.created += 1
+        sprite.reset(*args)
+        return sprite
+
+    def release(self, sprite):
+        sprite.kill()
+        self.free.append(sprite)
 
 
 class Platform(pygame.sprite.Sprite):
-    def __init__(self, x, y, w, h, *groups):
-        super().__init__(*groups)
-        self.img_normal = pygame.transform.scale(
-            load_image(PLATFORM_IMG, colorkey=-1), (w, h))
-        self.img_trap = pygame.transform.scale(
-            load_image(PLATFORM_TRAP_IMG, colorkey=-1), (w, h))
+    def __init__(self, x=0, y=0, w=PLATFORM_WIDTH, h=PLATFORM_HEIGHT, *groups):
+        super().__init__()
+        self.img_normal = ASSETS.image(PLATFORM_IMG, -1, (w, h))
+        self.img_trap = ASSETS.image(PLATFORM_TRAP_IMG, -1, (w, h))
+        self.rect = self.img_normal.get_rect()
+        self.reset(x, y)
+        # в группы добавляем после rect: SpatialGroup индексирует по нему
+        self.add(*groups)
+
+    def reset(self, x, y):
         self.image = self.img_normal
-        self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
         self.is_trap = False
+        self.coin = None
 
     def become_trap(self):
         self.is_trap = True
@@ -148,52 +754,553 @@ class Platform(pygame.sprite.Sprite):
 
 
 class Coin(pygame.sprite.Sprite):
-    def __init__(self, x, y, *groups):
-        super().__init__(*groups)
-        self.image = pygame.transform.scale(
-            load_image(COIN_IMG, colorkey=-1), (24, 24))
-        self.rect = self.image.get_rect(center=(x, y))
+    def __init__(self, x=0, y=0, platform=None, *groups):
+        super().__init__()
+        self.image = ASSETS.image(COIN_IMG, -1, COIN_SIZE)
+        self.rect = self.image.get_rect()
+        self.reset(x, y, platform)
+        self.add(*groups)
+
+    def reset(self, x, y, platform):
+        self.rect.center = (x, y)
+        self.platform = platform
 
 
 class Lava(AnimatedSprite):
     def __init__(self, *groups):
-        sheet = load_image(LAVA_SHEET_IMG, colorkey=-1)
+        sheet = ASSETS.image(LAVA_SHEET_IMG, -1)
         super().__init__(sheet, 8, 1, 0, 0, 8, *groups)
-        self.frames = [pygame.transform.scale(f, (SCREEN_WIDTH, LAVA_HEIGHT))
-                       for f in self.frames]
+        self.frames = list(ASSETS.frames(LAVA_SHEET_IMG, -1, 8,
+                                         (SCREEN_WIDTH, LAVA_HEIGHT)))
         self.image = self.frames[self.cur_frame]
         self.rect = self.image.get_rect()
+        self.reset()
+
+    def reset(self):
+        self.cur_frame = 0
+        self.counter_time = 0
+        self.image = self.frames[self.cur_frame]
         self.rect.bottom = SCREEN_HEIGHT
+        self.floor_y = SCREEN_HEIGHT
         self.lava_level = self.rect.top
 
+    def draw_fill(self, surface, top):
+        # плитки выше экрана пропускаем, начиная с первой видимой
+        if top < 0:
+            top = -(-top % LAVA_HEIGHT)
+        frame = self.image
+        for y in range(top, SCREEN_HEIGHT, LAVA_HEIGHT):
+            surface.blit(frame, (0, y))
+
     def rise(self, dy):
         self.rect.y -= dy
         self.lava_level = self.rect.top
 
+    def rebase(self, dy):
+        self.floor_y += dy
+        self.lava_level = self.rect.top
+
     def check_collision(self, player):
         lava_rect = pygame.Rect(0, self.lava_level, SCREEN_WIDTH,
-                                SCREEN_HEIGHT - self.lava_level)
+                                self.floor_y - self.lava_level)
         return lava_rect.colliderect(player.rect)
 
 
-class LavaSpark(pygame.sprite.Sprite):
-    def __init__(self, x, y, *groups):
-        super().__init__(*groups)
-        self.image = pygame.transform.scale(
-            load_image(SPARK_IMG, colorkey=-1), (10, 10))
-        self.rect = self.image.get_rect(center=(x, y))
-        self.vx = random.uniform(-1.5, 1.5)
-        self.vy = random.uniform(-4, -1)
-        self.alpha = 255
+# искры в массивах NumPy, спрайты из готовой шкалы прозрачности
+class ParticleSystem:
+    def __init__(self, image, capacity=SPARK_CAPACITY,
+                 rate=SPARK_EMISSION_RATE, fade=SPARK_FADE, seed=None):
+        self.capacity = capacity
+        self.cap = capacity
+        self.rate = rate
+        self.fade = fade
+        self.size = image.get_size()
+        self.pos = np.zeros((capacity, 2), dtype=np.float32)
+        self.vel = np.zeros((capacity, 2), dtype=np.float32)
+        self.alpha = np.zeros(capacity, dtype=np.int16)
+        self.emit_budget = 0.0
+        self.rng = np.random.default_rng(seed)
+        self.ramp = []
+        for level in range(SPARK_ALPHA_LEVELS):
+            surface = image.copy()
+            surface.set_alpha(level * 255 // (SPARK_ALPHA_LEVELS - 1))
+            self.ramp.append(surface)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alpha > 0))
+
+    def reseed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def clear(self):
+        self.alpha[:] = 0
+        self.emit_budget = 0.0
+
+    def set_cap(self, cap):
+        self.cap = max(0, min(cap, self.capacity))
+
+    def emit(self, count, y, width):
+        count = min(count, self.cap - len(self))
+        if count <= 0:
+            return 0
+        free = np.flatnonzero(self.alpha <= 0)[:count]
+        n = len(free)
+        w, h = self.size
+        self.pos[free, 0] = self.rng.integers(0, width, n, endpoint=True) - w / 2
+        self.pos[free, 1] = y - h / 2
+        self.vel[free, 0] = self.rng.uniform(-SPARK_SPEED_X, SPARK_SPEED_X, n)
+        self.vel[free, 1] = self.rng.uniform(*SPARK_SPEED_Y, n)
+        self.alpha[free] = 255
+        return n
+
+    def tick(self, dt, y, width):
+        self.emit_budget += dt * self.rate / 1000
+        count = int(self.emit_budget)
+        if count:
+            self.emit_budget -= count
+            self.emit(count, y, width)
 
-    def update(self, dt, *args):
-        self.rect.x += self.vx
-        self.rect.y += self.vy
-        self.alpha -= 5
-        if self.alpha <= 0:
-            self.kill()
+    def update(self):
+        # мёртвые частицы тоже сдвигаются, это дешевле, чем маска
+        self.pos += self.vel
+        self.alpha -= self.fade
+        np.maximum(self.alpha, 0, out=self.alpha)
+
+    def rebase(self, dy):
+        self.pos[:, 1] += dy
+
+    def screen_positions(self, dx, dy):
+        alive = np.flatnonzero(self.alpha > 0)
+        xs = np.floor(self.pos[alive, 0] + dx).astype(np.int32)
+        ys = np.floor(self.pos[alive, 1] + dy).astype(np.int32)
+        return alive, xs, ys
+
+    def rects(self, dx, dy):
+        _, xs, ys = self.screen_positions(dx, dy)
+        w, h = self.size
+        return [pygame.Rect(x, y, w, h) for x, y in zip(xs.tolist(), ys.tolist())]
+
+    def draw(self, surface, dx, dy, area=None):
+        alive, xs, ys = self.screen_positions(dx, dy)
+        if area is not None:
+            visible = (ys + self.size[1] > area.top) & (ys < area.bottom)
+            alive, xs, ys = alive[visible], xs[visible], ys[visible]
+        if not len(alive):
+            return
+        levels = self.alpha[alive].astype(np.int32) * (SPARK_ALPHA_LEVELS - 1) // 255
+        ramp = self.ramp
+        surface.blits([(ramp[level], (x, y)) for level, x, y in
+                       zip(levels.tolist(), xs.tolist(), ys.tolist())],
+                      doreturn=False)
+
+
+# куски уровня по chunk_rows рядов готовит фоновый поток
+class LevelGenerator:
+    def __init__(self, seed, chunk_rows=CHUNK_ROWS, ahead=CHUNKS_AHEAD):
+        self.rng = random.Random(seed)
+        self.chunk_rows = chunk_rows
+        # шанс фиксируем при создании: поток может работать после его смены
+        self.coin_chance = COIN_SPAWN_CHANCE
+        self.next_row = 0
+        self.prev_x = None
+        self.chunks = queue.Queue(maxsize=ahead)
+        self.pending = deque()
+        self.stopped = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def make_chunk(self):
+        chunk = []
+        for _ in range(self.chunk_rows):
+            if self.prev_x is None:
+                x = self.rng.randint(0, SCREEN_WIDTH - PLATFORM_WIDTH)
+            else:
+                offset = self.rng.randint(PLATFORM_OFFSET_MIN,
+                                          PLATFORM_OFFSET_MAX)
+                x = self.prev_x + offset
+                if x < 0 or x > SCREEN_WIDTH - PLATFORM_WIDTH:
+                    x = self.prev_x - offset
+            chunk.append((self.next_row, x,
+                          self.rng.random() < self.coin_chance))
+            self.prev_x = x
+            self.next_row += 1
+        return chunk
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                chunk = self.make_chunk()
+                while not self.stopped.is_set():
+                    try:
+                        self.chunks.put(chunk, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception as e:
+            # ошибку отдаст take(), иначе игра ждала бы кусок вечно
+            self.error = e
+
+    def take(self):
+        while not self.pending:
+            try:
+                self.pending.extend(self.chunks.get(timeout=0.1))
+            except queue.Empty:
+                if self.error is not None:
+                    raise self.error
+                if not self.thread.is_alive():
+                    raise RuntimeError("Генератор уровня остановлен")
+        return self.pending.popleft()
+
+    def close(self):
+        self.stopped.set()
+
+
+# качество меняется по среднему времени кадра в скользящем окне
+class QualityGovernor:
+    def __init__(self, budget, tiers=QUALITY_TIERS, window=GOVERNOR_WINDOW):
+        self.budget = budget
+        self.tiers = tiers
+        self.tier = len(tiers) - 1
+        self.samples = deque(maxlen=window)
+        self.mean = 0.0
+
+    def observe(self, frame_ms):
+        samples = self.samples
+        samples.append(frame_ms)
+        if len(samples) < samples.maxlen:
+            return None
+        self.mean = sum(samples) / len(samples)
+        if self.mean > self.budget * GOVERNOR_DOWNGRADE and self.tier > 0:
+            self.tier -= 1
+        elif (self.mean < self.budget * GOVERNOR_UPGRADE and
+              self.tier < len(self.tiers) - 1):
+            self.tier += 1
+        else:
+            return None
+        samples.clear()
+        return self.tiers[self.tier]
+
+
+# время фаз кадра в кольцевом буфере на capacity кадров
+class FrameProfiler:
+    def __init__(self, phases=PROFILER_PHASES, capacity=PROFILER_SAMPLES):
+        self.enabled = False
+        self.overlay = False
+        self.export_path = None
+        self.phases = phases
+        self.slot = {name: i for i, name in enumerate(phases)}
+        self.samples = np.zeros((capacity, len(phases)))
+        self.current = [0.0] * len(phases)
+        self.count = 0
+        self.mark = 0.0
+        self.overlay_surface = None
+        self.overlay_rect = None
+        self.overlay_time = 0.0
+        self.overlay_frames = 0
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.enabled = self.overlay or self.export_path is not None
+        self.mark = time.perf_counter()
+
+    def begin(self):
+        if self.enabled:
+            self.mark = time.perf_counter()
+
+    def lap(self, phase):
+        if self.enabled:
+            now = time.perf_counter()
+            self.current[self.slot[phase]] += now - self.mark
+            self.mark = now
+
+    def end_frame(self):
+        if self.enabled:
+            self.samples[self.count % len(self.samples)] = self.current
+            self.count += 1
+            self.current = [0.0] * len(self.phases)
+
+    def history(self):
+        # кадры в хронологическом порядке, в миллисекундах
+        capacity = len(self.samples)
+        if self.count <= capacity:
+            return self.samples[:self.count] * 1000
+        return np.roll(self.samples, -(self.count % capacity), axis=0) * 1000
+
+    def summary(self):
+        data = self.history()
+        result = {}
+        for i, phase in enumerate(self.phases):
+            column = data[:, i]
+            if not len(column):
+                continue
+            p50, p95, p99 = np.percentile(column, (50, 95, 99))
+            result[phase] = {"last": float(column[-1]),
+                             "mean": float(column.mean()),
+                             "p50": float(p50), "p95": float(p95),
+                             "p99": float(p99)}
+        return result
+
+    def draw(self, surface, font):
+        now = time.perf_counter()
+        if (self.overlay_surface is None or self.overlay_frames == 0 or
+                now - self.overlay_time >= 1 / PROFILER_OVERLAY_HZ):
+            self.overlay_frames = self.count
+            self.overlay_surface = self.render_overlay(font)
+            self.overlay_time = now
+        rect = self.overlay_surface.get_rect(topright=(SCREEN_WIDTH - 10, 90))
+        self.overlay_rect = surface.blit(self.overlay_surface, rect)
+        return self.overlay_rect
+
+    def render_overlay(self, font):
+        columns = ("мс", "p50", "p95", "p99")
+        rows = [("фаза",) + columns]
+        for phase, stats in self.summary().items():
+            rows.append((phase,) + tuple(
+                f"{stats[key]:.2f}" for key in ("last", "p50", "p95", "p99")))
+        line_h = font.get_linesize()
+        widths = (80, 55, 55, 55, 55)
+        overlay = pygame.Surface((sum(widths) + 10, line_h * len(rows) + 10),
+                                 pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+        for j, row in enumerate(rows):
+            x = 5
+            for width, text in zip(widths, row):
+                overlay.blit(font.render(text, True, WHITE), (x, 5 + j * line_h))
+                x += width
+        return overlay
+
+    def export(self, path):
+        data = self.history()
+        if path.endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"frames": self.count, "phases": list(self.phases),
+                           "summary": self.summary(),
+                           "samples_ms": data.round(4).tolist()},
+                          f, ensure_ascii=False, indent=2)
         else:
-            self.image.set_alpha(self.alpha)
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(self.phases)
+                writer.writerows(data.round(4).tolist())
+
+
+# журнал забегов дописывается кусками, сводка по нему - отдельно
+class ScoreStore:
+    def __init__(self, directory=SAVE_DIR):
+        self.directory = directory
+        self.summary = self.empty_summary()
+        self.queue = None
+        if directory is None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.summary_path = os.path.join(directory, RUNS_SUMMARY)
+        self.load()
+        self.queue = queue.Queue()
+        # фоновый поток не держит процесс, если до close() не дошло;
+        # atexit всё равно даёт ему дописать очередь
+        self.thread = threading.Thread(
+            target=self.write_loop, args=(self.queue, self.summary["segment"]),
+            daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def empty_summary(self):
+        return {"runs": 0, "best_score": 0, "last_score": None,
+                "total_score": 0, "total_coins": 0, "total_jumps": 0,
+                "powerups": [0] * (len(POWERUP_PRICES) + 1), "segment": 0,
+                "log_size": 0}
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, RUNS_LOG.format(segment))
+
+    def find_segments(self):
+        prefix, suffix = RUNS_LOG.split("{}")
+        segments = []
+        for name in os.listdir(self.directory):
+            number = name[len(prefix):len(name) - len(suffix)]
+            if (name.startswith(prefix) and name.endswith(suffix) and
+                    number.isdigit()):
+                segments.append(int(number))
+        return sorted(segments)
+
+    def load(self):
+        try:
+            with open(self.summary_path, encoding="utf-8") as f:
+                self.summary.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        for segment in self.find_segments():
+            path = self.segment_path(segment)
+            if segment < self.summary["segment"]:
+                # уже учтён в сводке, остался после прерванной смены куска
+                os.remove(path)
+                continue
+            if segment > self.summary["segment"]:
+                self.summary["segment"] = segment
+                self.summary["log_size"] = 0
+            size = os.path.getsize(path)
+            whole = size - size % RUN_RECORD.size
+            if whole != size:
+                # обрывок последней записи после сбоя отбрасываем
+                with open(path, "r+b") as f:
+                    f.truncate(whole)
+            for record in self.iter_runs(self.summary["log_size"]):
+                self.fold(record)
+            self.summary["log_size"] = whole
+
+    def iter_runs(self, start=0):
+        if self.directory is None:
+            return
+        path = self.segment_path(self.summary["segment"])
+        if not os.path.isfile(path):
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            while True:
+                chunk = f.read(RUN_RECORD.size * STORE_READ_CHUNK)
+                chunk = chunk[:len(chunk) - len(chunk) % RUN_RECORD.size]
+                if not chunk:
+                    break
+                yield from RUN_RECORD.iter_unpack(chunk)
+
+    def fold(self, record):
+        _, score, coins, jumps, powerup, _ = record
+        summary = self.summary
+        summary["runs"] += 1
+        summary["best_score"] = max(summary["best_score"], score)
+        summary["last_score"] = score
+        summary["total_score"] += score
+        summary["total_coins"] += coins
+        summary["total_jumps"] += jumps
+        summary["powerups"][powerup] += 1
+
+    def add_run(self, score, coins, jumps, powerup, seed):
+        code = list(POWERUP_PRICES).index(powerup) + 1 if powerup else 0
+        record = (time.time(), score, coins, jumps, code, seed)
+        self.fold(record)
+        if self.queue is None:
+            return
+        self.summary["log_size"] += RUN_RECORD.size
+        self.queue.put(("run", RUN_RECORD.pack(*record)))
+        if self.summary["runs"] % STORE_CHECKPOINT_EVERY == 0:
+            self.checkpoint()
+
+    def checkpoint(self):
+        # заполненный кусок весь учтён в этой сводке, дальше пишем в новый
+        if self.summary["log_size"] >= RUN_RECORD.size * STORE_SEGMENT_RUNS:
+            self.summary["segment"] += 1
+            self.summary["log_size"] = 0
+        self.queue.put(("summary", (json.dumps(self.summary),
+                                    self.summary["segment"])))
+
+    @property
+    def best_score(self):
+        return self.summary["best_score"]
+
+    @property
+    def last_score(self):
+        return self.summary["last_score"]
+
+    def stats(self):
+        summary = self.summary
+        runs = summary["runs"] or 1
+        return {"runs": summary["runs"], "best_score": summary["best_score"],
+                "mean_score": summary["total_score"] / runs,
+                "mean_coins": summary["total_coins"] / runs,
+                "mean_jumps": summary["total_jumps"] / runs,
+                "powerups": dict(zip(["none"] + list(POWERUP_PRICES),
+                                     summary["powerups"]))}
+
+    def write_loop(self, items, segment):
+        log = open(self.segment_path(segment), "ab")
+        try:
+            while True:
+                item = items.get()
+                if item is None:
+                    break
+                kind, data = item
+                if kind == "run":
+                    log.write(data)
+                    log.flush()
+                    continue
+                # сводка не должна ссылаться на записи, которых нет на диске
+                os.fsync(log.fileno())
+                data, next_segment = data
+                self.write_summary(data)
+                if next_segment != segment:
+                    log.close()
+                    os.remove(self.segment_path(segment))
+                    segment = next_segment
+                    log = open(self.segment_path(segment), "ab")
+        finally:
+            log.close()
+
+    def write_summary(self, data):
+        tmp_path = self.summary_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.summary_path)
+
+    def close(self):
+        if self.queue is not None:
+            self.checkpoint()
+            self.queue.put(None)
+            self.queue = None
+            self.thread.join(STORE_CLOSE_TIMEOUT)
+
+
+# заголовок с зерном, записи (шаг, тип, код) и запись конца
+class Recorder:
+    def __init__(self, path, seed):
+        self.file = open(path, "wb")
+        self.file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed))
+        self.count = 0
+
+    def record(self, step, kind, code=0):
+        self.file.write(REPLAY_RECORD.pack(step, kind, code))
+        self.count += 1
+
+    def close(self, step):
+        self.file.write(REPLAY_RECORD.pack(step, REPLAY_END, 0))
+        self.file.close()
+
+
+class Replay:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, self.seed = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"Файл '{path}' не является записью игры")
+        self.records = deque(REPLAY_RECORD.iter_unpack(
+            data[REPLAY_HEADER.size:]))
+        # без записи конца (сессия оборвалась) играем до гибели
+        self.end_step = None
+        if self.records and self.records[-1][1] == REPLAY_END:
+            self.end_step = self.records.pop()[0]
+
+    def __len__(self):
+        return len(self.records)
+
+    def finished(self, game):
+        return self.end_step is not None and game.sim_steps >= self.end_step
+
+    def apply(self, game):
+        # всё, что было введено до очередного шага, подаётся перед ним
+        records = self.records
+        while records and records[0][0] <= game.sim_steps:
+            _, kind, code = records.popleft()
+            if kind == REPLAY_KEYDOWN:
+                game.handle_event(pygame.event.Event(pygame.KEYDOWN, key=code))
+            elif kind == REPLAY_KEYUP:
+                game.handle_event(pygame.event.Event(pygame.KEYUP, key=code))
+            elif kind == REPLAY_BUY:
+                game.buy_powerup(list(POWERUP_PRICES)[code])
+            elif kind == REPLAY_RESTART:
+                game.reset_game(initial=False)
 
 
 class PowerUp:
@@ -218,17 +1325,15 @@ class PowerUp:
 class Player(pygame.sprite.Sprite):
     def __init__(self, x, y, *groups):
         super().__init__(*groups)
-        stand_img = load_image(PLAYER_STAND_IMG, colorkey=-1)
-        jump_img = load_image(PLAYER_JUMP_IMG, colorkey=-1)
-        scale = 0.5
-        self.orig_image_stand = pygame.transform.scale(
-            stand_img, (int(stand_img.get_width() * scale),
-                        int(stand_img.get_height() * scale)))
-        self.orig_image_jump = pygame.transform.scale(
-            jump_img, (int(jump_img.get_width() * scale),
-                       int(jump_img.get_height() * scale)))
+        self.orig_image_stand = ASSETS.image(PLAYER_STAND_IMG, -1, PLAYER_SIZE)
+        self.orig_image_jump = ASSETS.image(PLAYER_JUMP_IMG, -1, PLAYER_SIZE)
+        self.coyote_time_limit = 100
+        self.rect = self.orig_image_stand.get_rect()
+        self.reset(x, y)
+
+    def reset(self, x, y):
+        # картинки остаются, сбрасывается только состояние
         self.image = self.orig_image_stand
-        self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
         self.player_start_y = y
@@ -240,20 +1345,17 @@ class Player(pygame.sprite.Sprite):
         self.coins = 0
         self.double_jump_unlocked = False
         self.double_jump_used = False
-        self.jump_sound = load_sound(SOUND_JUMP)
-        self.coin_sound = load_sound(SOUND_COIN)
-        self.death_sound = load_sound(SOUND_DEATH)
         self.is_jumping = False
         self.jump_timer = 0
         self.facing_right = True
         self.current_platform = None
         self.coyote_timer = 0
-        self.coyote_time_limit = 100
         self.max_extra_jumps = 0
         self.extra_jumps_used = 0
         self.total_jumps = 0
+        self.death_cause = None
 
-    def update(self, dt, platforms, trap_platforms, game_ref):
+    def update(self, dt, game_ref):
         if self.jump_timer > 0:
             self.jump_timer -= dt
             if self.jump_timer <= 0:
@@ -265,26 +1367,24 @@ class Player(pygame.sprite.Sprite):
             self.rect.left = SCREEN_WIDTH
         elif self.rect.left > SCREEN_WIDTH:
             self.rect.right = 0
-        collidex = pygame.sprite.spritecollide(self, platforms, False)
-        if collidex:
+        rects = game_ref.platform_rects
+        collidex = rects.colliding(self.rect, is_trap=False)
+        if len(collidex):
             if self.vx > 0:
-                self.rect.right = min(p.rect.left for p in collidex)
+                self.rect.right = int(rects.x[collidex].min())
             elif self.vx < 0:
-                self.rect.left = max(p.rect.right for p in collidex)
+                self.rect.left = int((rects.x[collidex] + rects.w[collidex]).max())
         self.rect.y += self.vy
         self.on_ground = False
         if self.vy >= 0:
-            for p in platforms:
-                if self.rect.right > p.rect.left and self.rect.left < p.rect.right:
-                    gap = p.rect.top - self.rect.bottom
-                    if 0 <= gap < 5:
-                        self.rect.bottom = p.rect.top
-                        self.vy = 0
-                        self.on_ground = True
-                        if p != self.current_platform:
-                            game_ref.convert_platforms_below_to_traps(p.rect.y)
-                            self.current_platform = p
-                        break
+            p = rects.landing(self.rect, LANDING_TOLERANCE)
+            if p is not None:
+                self.rect.bottom = p.rect.top
+                self.vy = 0
+                self.on_ground = True
+                if p != self.current_platform:
+                    game_ref.convert_platforms_below_to_traps(p.rect.y)
+                    self.current_platform = p
         if self.on_ground:
             self.extra_jumps_used = 0
         if self.on_ground:
@@ -298,23 +1398,21 @@ class Player(pygame.sprite.Sprite):
         if not self.facing_right:
             new_img = pygame.transform.flip(new_img, True, False)
         self.image = new_img
-        if pygame.sprite.spritecollide(self, trap_platforms, False):
-            self.kill_player()
+        if len(rects.colliding(self.rect, is_trap=True)):
+            self.kill_player("trap")
 
     def jump(self):
         if self.on_ground:
             self.vy = PLAYER_JUMP_SPEED
             self.on_ground = False
             self.extra_jumps_used = 0
-            if self.jump_sound:
-                self.jump_sound.play()
+            AUDIO.play("jump")
             self.total_jumps += 1
             return True
         elif self.extra_jumps_used < self.max_extra_jumps:
             self.vy = PLAYER_JUMP_SPEED
             self.extra_jumps_used += 1
-            if self.jump_sound:
-                self.jump_sound.play()
+            AUDIO.play("jump")
             self.total_jumps += 1
             return True
         return False
@@ -332,245 +1430,354 @@ class Player(pygame.sprite.Sprite):
 
     def pick_coin(self):
         self.coins += 1
-        if self.coin_sound:
-            self.coin_sound.play()
+        AUDIO.play("coin")
 
-    def kill_player(self):
-        if self.death_sound:
-            self.death_sound.play()
+    def kill_player(self, cause):
+        AUDIO.play("death")
+        self.death_cause = cause
         self.vx = 0
         self.vy = 0
         self.rect.y = 999999
 
 
+# буфер перерисовывается с частотой hz, отметка игрока - каждый кадр
 class MiniMap:
-    def __init__(self, x, y, w, h, game):
+    def __init__(self, x, y, w, h, game, hz=MINIMAP_HZ):
         self.rect = pygame.Rect(x, y, w, h)
         self.game = game
         try:
-            self.frame_img = pygame.transform.scale(
-                load_image(MINIMAP_FRAME), (w, h))
+            self.frame_img = ASSETS.image(MINIMAP_FRAME, None, (w, h))
         except Exception:
             self.frame_img = None
         self.view_height = 1200
         self.view_width = self.game.map_width
-
-    def update(self):
-        player_y = self.game.player.rect.y
+        self.scale_x = w / float(self.view_width)
+        self.scale_y = h / float(self.view_height)
+        self.surface = pygame.Surface((w, h))
+        self.marks = {}
+        self.mark_images = {}
+        self.view_top = None
+        self.elapsed = 0
+        self.set_rate(hz)
+
+    def set_rate(self, hz):
+        self.interval = 1000 / hz
+
+    def invalidate(self):
+        self.view_top = None
+
+    def update(self, dt=0):
+        player_y = self.game.camera.view_y(self.game.player.rect.y)
         min_y = 10
         max_y = SCREEN_HEIGHT - self.rect.height - 10
         desired_y = max_y - (player_y * 0.1)
         self.rect.y = max(min_y, min(desired_y, max_y))
-
-    def draw(self, surface):
-        pygame.draw.rect(surface, (30, 30, 30), self.rect)
-        if self.frame_img:
-            surface.blit(self.frame_img, (self.rect.x, self.rect.y))
+        self.elapsed += dt
+        if self.elapsed >= self.interval:
+            self.elapsed = 0
+            self.invalidate()
+
+    def mark_image(self, color, w, h):
+        key = (color, w, h)
+        image = self.mark_images.get(key)
+        if image is None:
+            image = self.mark_images[key] = pygame.Surface((w, h))
+            image.fill(color)
+        return image
+
+    def mark(self, sprite, marks):
+        # масштабированные координаты считаем один раз на положение спрайта
+        x, y = sprite.rect.topleft
+        cached = self.marks.get(sprite)
+        if cached is None or cached[0] != x or cached[1] != y:
+            cached = (x, y, int(x * self.scale_x), y * self.scale_y,
+                      max(1, int(sprite.rect.width * self.scale_x)),
+                      max(1, int(sprite.rect.height * self.scale_y)))
+        marks[sprite] = cached
+        return cached
+
+    def refresh(self):
+        game = self.game
         half_h = self.view_height // 2
-        player_y = self.game.player.rect.centery
-        view_top = player_y - half_h
-        view_bottom = player_y + half_h
-        world_w = float(self.view_width)
-        world_h = float(view_bottom - view_top)
-        if world_h <= 0:
-            return
-
-        def minimap_pos(x, y):
-            nx = x / world_w
-            ny = (y - view_top) / world_h
-            return self.rect.x + nx * self.rect.width, \
-                   self.rect.y + ny * self.rect.height
-
-        for pf in self.game.platforms:
-            if pf.rect.bottom < view_top or pf.rect.top > view_bottom:
-                continue
-            mini_x = self.rect.x + (pf.rect.x / world_w) * self.rect.width
-            mini_y = self.rect.y + ((pf.rect.y - view_top) / world_h) * self.rect.height
-            mini_w = pf.rect.width * (self.rect.width / world_w)
-            mini_h = pf.rect.height * (self.rect.height / world_h)
-            color = RED if pf.is_trap else GREEN
-            pygame.draw.rect(surface, color, (mini_x, mini_y, mini_w, mini_h))
-
-        for tp in self.game.trap_platforms:
-            if tp.rect.bottom < view_top or tp.rect.top > view_bottom:
-                continue
-            mini_x = self.rect.x + (tp.rect.x / world_w) * self.rect.width
-            mini_y = self.rect.y + ((tp.rect.y - view_top) / world_h) * self.rect.height
-            mini_w = tp.rect.width * (self.rect.width / world_w)
-            mini_h = tp.rect.height * (self.rect.height / world_h)
-            pygame.draw.rect(surface, RED, (mini_x, mini_y, mini_w, mini_h))
-
-        for coin in self.game.coins_group:
-            if coin.rect.bottom < view_top or coin.rect.top > view_bottom:
-                continue
-            mx, my = minimap_pos(coin.rect.centerx, coin.rect.centery)
-            pygame.draw.circle(surface, YELLOW, (int(mx), int(my)), 2)
-
-        lava_top = self.game.lava.lava_level
+        self.view_top = view_top = game.player.rect.centery - half_h
+        view_bottom = view_top + self.view_height
+        offset_y = view_top * self.scale_y
+        surface = self.surface
+        surface.fill((30, 30, 30))
+        if self.frame_img:
+            surface.blit(self.frame_img, (0, 0))
+        marks = {}
+        batch = []
+        for group in (game.platforms, game.trap_platforms):
+            for pf in group.query(view_top, view_bottom):
+                _, _, mx, my, mw, mh = self.mark(pf, marks)
+                color = RED if pf.is_trap else GREEN
+                batch.append((self.mark_image(color, mw, mh),
+                              (mx, int(my - offset_y))))
+        surface.blits(batch, False)
+        for coin in game.coins_group.query(view_top, view_bottom):
+            _, _, mx, my, mw, mh = self.mark(coin, marks)
+            pygame.draw.circle(surface, YELLOW, (mx + mw // 2,
+                                                 int(my - offset_y) + mh // 2), 2)
+        self.marks = marks
+        lava_top = max(game.lava.lava_level, view_top)
         if lava_top < view_bottom:
-            if lava_top < view_top:
-                lava_top = view_top
-            _, lava_my = minimap_pos(0, lava_top)
-            lava_rect = pygame.Rect(self.rect.x, lava_my, self.rect.width,
-                                    self.rect.bottom - lava_my)
-            pygame.draw.rect(surface, (200, 50, 50), lava_rect)
+            lava_my = int((lava_top - view_top) * self.scale_y)
+            surface.fill((200, 50, 50), (0, lava_my, self.rect.width,
+                                         self.rect.height - lava_my))
 
-        mx, my = minimap_pos(self.game.player.rect.centerx,
-                             self.game.player.rect.centery)
-        pygame.draw.circle(surface, BLUE, (int(mx), int(my)), 3)
+    def draw(self, surface):
+        if self.view_top is None:
+            self.refresh()
+        surface.blit(self.surface, self.rect)
+        player = self.game.player.rect
+        mx = self.rect.x + player.centerx * self.scale_x
+        my = self.rect.y + (player.centery - self.view_top) * self.scale_y
+        if self.rect.collidepoint(mx, my):
+            pygame.draw.circle(surface, BLUE, (int(mx), int(my)), 3)
 
 
 class Game:
-    def __init__(self):
-        pygame.init()
+    def __init__(self, headless=False, seed=None, render=True,
+                 dirty_rects=False, fps=FPS):
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
+        self.headless = headless
+        self.render = render
+        self.dirty_rendering = dirty_rects
+        self.fps = fps
+        self.accumulator = 0.0
+        self.previous = None
+        self.sim_steps = 0
+        self.recorder = None
+        self.profiler = FrameProfiler()
+        self.governor = QualityGovernor(1000 / fps)
+        self.text_antialias = True
+        self.view_dy = 0
+        self.player_pos = (0, 0)
+        self.lava_top = 0
+        self.full_redraw = True
+        self.last_camera_dy = None
+        self.last_hud = None
+        self.prev_dynamic_rects = []
+        self.hud_rects = []
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.started = time.perf_counter()
+        self.startup_times = {}
+        # поднимаем только нужные подсистемы, а не всё подряд через pygame.init()
+        pygame.display.init()
+        pygame.font.init()
+        # маленький буфер микшера - меньше задержка звука
+        pygame.mixer.pre_init(AUDIO_FREQUENCY, -16, 2, AUDIO_BUFFER)
+        try:
+            pygame.mixer.init()
+        except pygame.error as e:
+            print(f"Не удалось запустить звук: {e}. Звук отключён.")
         pygame.display.set_caption(GAME_TITLE)
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         self.clock = pygame.time.Clock()
         self.running = True
         self.state = "START"
         self.font = pygame.font.SysFont(FONT_NAME, FONT_SIZE)
+        self.text_cache = TextCache()
+        self.fonts = {}
+        self.menu_surfaces = {}
+        if not ASSETS.pack_checked:
+            ASSETS.attach_pack(open_asset_pack())
         self.music_bg = None
-        if os.path.isfile(os.path.join("data", MUSIC_BACKGROUND)):
-            pygame.mixer.music.load(os.path.join("data", MUSIC_BACKGROUND))
-            pygame.mixer.music.set_volume(0.5)
+        self.music_loaded = False
         self.all_sprites = pygame.sprite.Group()
-        self.platforms = pygame.sprite.Group()
-        self.trap_platforms = pygame.sprite.Group()
-        self.coins_group = pygame.sprite.Group()
-        self.lava_sparks = pygame.sprite.Group()
+        self.platforms = SpatialGroup()
+        self.trap_platforms = SpatialGroup()
+        self.coins_group = SpatialGroup()
+        self.lava_sparks = None
+        self.world = WorldStream()
+        self.platform_rects = RectArrays()
+        self.coin_rects = RectArrays()
+        self.generator = None
+        self.row_base_y = SCREEN_HEIGHT - 150
+        self.platform_pool = None
+        self.coin_pool = None
         self.map_width = SCREEN_WIDTH
         self.player = None
         self.lava = None
+        self.camera = None
+        self.minimap = None
+        self.scores = None
         self.previous_score = None
         self.best_score = 0
-        self.reset_game(initial=True)
-        pygame.time.set_timer(pygame.USEREVENT + 1, SPARK_GENERATE_INTERVAL)
         self.active_powerup = None
-        self.minimap = MiniMap(10, 400, 150, 150, self)
-        self.camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
-        self.buy_sound = load_sound("buy_sound.wav")
+        # стартовому экрану нужны только фон и шрифт, остальное догружается,
+        # пока он показан
+        self.loading = self.load_steps()
+        if headless:
+            self.finish_loading()
+
+    def load_steps(self):
+        for entry in PRELOAD_IMAGES:
+            ASSETS.preload([entry])
+            yield
+        ASSETS.preload([], PACK_FRAMES)
+        yield
+        AUDIO.init()
+        yield
+        self.load_music()
+        yield
+        self.scores = ScoreStore(None if self.headless else SAVE_DIR)
+        self.previous_score = self.scores.last_score
+        self.best_score = self.scores.best_score
+        yield
+        self.lava_sparks = ParticleSystem(ASSETS.image(SPARK_IMG, -1, SPARK_SIZE))
+        self.platform_pool = SpritePool(Platform, PLATFORM_POOL_SIZE)
+        self.coin_pool = SpritePool(Coin, COIN_POOL_SIZE)
+        yield
+        self.reset_game(initial=True)
+        self.minimap = MiniMap(*MINIMAP_RECT, self)
+        self.report_startup("ready_ms", "Игра готова")
+
+    def load_step(self):
+        try:
+            next(self.loading)
+        except StopIteration:
+            self.loading = None
+
+    def finish_loading(self):
+        while self.loading is not None:
+            self.load_step()
+
+    def load_music(self):
+        path = os.path.join(DATA_DIR, MUSIC_BACKGROUND)
+        if pygame.mixer.get_init() is None or not os.path.isfile(path):
+            return
+        pygame.mixer.music.load(path)
+        pygame.mixer.music.set_volume(0.5)
+        self.music_loaded = True
+        if self.state in ("START", "HELP", "HOW_TO_PLAY"):
+            pygame.mixer.music.play(-1)
+
+    def report_startup(self, key, label):
+        if key in self.startup_times:
+            return
+        elapsed = (time.perf_counter() - self.started) * 1000
+        self.startup_times[key] = elapsed
+        if not self.headless:
+            print(f"{label} через {elapsed:.0f} мс")
+
+    def spawn_row(self, row):
+        index, x, has_coin = row
+        pf = self.platform_pool.acquire(x, self.row_base_y - index * PLATFORM_GAP)
+        pf.add(self.all_sprites, self.platforms)
+        self.platform_rects.add(pf)
+        if has_coin:
+            pf.coin = self.coin_pool.acquire(pf.rect.centerx, pf.rect.top - 12,
+                                             pf)
+            pf.coin.add(self.all_sprites, self.coins_group)
+            self.coin_rects.add(pf.coin)
+        self.world.push(pf)
+        return pf
+
+    def release_row(self, pf):
+        if pf.coin is not None:
+            self.coin_rects.remove(pf.coin)
+            self.coin_pool.release(pf.coin)
+        self.platform_rects.remove(pf)
+        self.platform_pool.release(pf)
+
+    def release_coin(self, coin):
+        coin.platform.coin = None
+        self.coin_rects.remove(coin)
+        self.coin_pool.release(coin)
 
     def update_world(self):
         removal_threshold = self.player.rect.y + (5 * PLATFORM_GAP)
-        for group in (self.platforms, self.trap_platforms, self.coins_group):
-            for obj in list(group):
-                if obj.rect.y > removal_threshold:
-                    group.remove(obj)
-                    if obj in self.all_sprites:
-                        self.all_sprites.remove(obj)
-        if self.platforms:
-            highest_platform = min(self.platforms, key=lambda p: p.rect.y)
-            highest_y = highest_platform.rect.y
-            prev_x = highest_platform.rect.x
-        else:
-            highest_y = self.player.rect.y - PLATFORM_GAP
-            prev_x = random.randint(0, SCREEN_WIDTH - PLATFORM_WIDTH)
+        for pf in self.world.pop_below(removal_threshold):
+            self.release_row(pf)
+        highest = self.world.highest()
         target_y = self.player.rect.y - (6 * PLATFORM_GAP)
-        while highest_y > target_y:
-            new_y = highest_y - PLATFORM_GAP
-            offset = random.randint(-250, 230)
-            x_candidate = prev_x + offset
-            if x_candidate < 0 or x_candidate > SCREEN_WIDTH - PLATFORM_WIDTH:
-                offset = -offset
-                x_candidate = prev_x + offset
-            new_pf = Platform(x_candidate, new_y, PLATFORM_WIDTH, PLATFORM_HEIGHT,
-                              self.all_sprites, self.platforms)
-            if random.random() < COIN_SPAWN_CHANCE:
-                Coin(new_pf.rect.centerx, new_pf.rect.top - 12,
-                     self.all_sprites, self.coins_group)
-            highest_y = new_y
-            prev_x = x_candidate
+        # ряды уже готовы в очереди генератора, здесь только создаём спрайты
+        while highest is None or highest.rect.y > target_y:
+            highest = self.spawn_row(self.generator.take())
 
     def recenter_world(self):
-        if self.player.rect.y < 100:
-            offset = 100 - self.player.rect.y
-            for sprite in self.all_sprites:
-                sprite.rect.y += offset
-            self.player.max_height_reached -= offset
-
-    def spawn_platforms_above(self):
-        if self.platforms:
-            highest_y = min(p.rect.y for p in self.platforms)
-        else:
-            highest_y = SCREEN_HEIGHT - 150
-        target_y = highest_y - 600
-        current_y = highest_y - PLATFORM_GAP
-        if self.platforms:
-            sorted_platforms = sorted(self.platforms, key=lambda p: p.rect.y)
-            prev_platform = sorted_platforms[0]
-        else:
-            prev_platform = None
-        while current_y >= target_y:
-            if prev_platform:
-                offset = random.randint(-250, 230)
-                x_candidate = prev_platform.rect.x + offset
-                if x_candidate < 0 or x_candidate > SCREEN_WIDTH - PLATFORM_WIDTH:
-                    offset = -offset
-                    x_candidate = prev_platform.rect.x + offset
-                x = x_candidate
-            else:
-                x = random.randint(0, SCREEN_WIDTH - PLATFORM_WIDTH)
-            new_pf = Platform(x, current_y, PLATFORM_WIDTH, PLATFORM_HEIGHT,
-                              self.all_sprites, self.platforms)
-            if random.random() < COIN_SPAWN_CHANCE:
-                Coin(new_pf.rect.centerx, new_pf.rect.top - 12,
-                     self.all_sprites, self.coins_group)
-            prev_platform = new_pf
-            current_y -= PLATFORM_GAP
+        # Координаты мировые, камера смещает их при отрисовке. Сдвигаем мир
+        # целиком только изредка, чтобы числа не росли без предела.
+        if self.player.rect.y < -WORLD_REBASE_LIMIT:
+            self.rebase_world(WORLD_REBASE_LIMIT)
+
+    def rebase_world(self, offset):
+        for sprite in self.all_sprites:
+            sprite.rect.y += offset
+        for group in (self.platforms, self.trap_platforms, self.coins_group):
+            group.rebase(offset)
+        self.platform_rects.rebase(offset)
+        self.coin_rects.rebase(offset)
+        self.lava.rebase(offset)
+        self.lava_sparks.rebase(offset)
+        self.camera.rebase(offset)
+        self.minimap.invalidate()
+        cam_dy, px, py, lava_top = self.previous
+        self.previous = (cam_dy - offset, px, py + offset, lava_top + offset)
+        self.player.player_start_y += offset
+        self.player.max_height_reached += offset
+        self.row_base_y += offset
 
     def reset_game(self, initial=False):
+        for pf in self.world:
+            self.release_row(pf)
         self.all_sprites.empty()
         self.platforms.empty()
         self.trap_platforms.empty()
         self.coins_group.empty()
-        self.lava_sparks.empty()
-        self.player = Player(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 300,
-                             self.all_sprites)
-        self.lava = Lava(self.all_sprites)
-        self.player.player_start_y = self.player.rect.y
-        self.player.max_height_reached = self.player.rect.y
-        self.player.score = 0.0
-        self.player.total_jumps = 0
+        self.lava_sparks.clear()
+        self.lava_sparks.reseed(self.rng.getrandbits(32))
+        self.world.clear()
+        if self.generator is not None:
+            self.generator.close()
+        self.generator = LevelGenerator(self.rng.getrandbits(32))
+        self.row_base_y = SCREEN_HEIGHT - 150
+        self.full_redraw = True
+        # игрок и лава переживают рестарт: ресурсы уже загружены
+        if self.player is None:
+            self.player = Player(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 300)
+            self.lava = Lava()
+        else:
+            self.player.reset(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 300)
+            self.lava.reset()
+        self.all_sprites.add(self.player, self.lava)
+        self.camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
+        if self.minimap is not None:
+            self.minimap.invalidate()
         bottom_platform = self.generate_platforms()
         if bottom_platform:
             self.player.rect.bottom = bottom_platform.rect.top
             self.player.rect.centerx = bottom_platform.rect.centerx
             self.player.on_ground = True
+        self.accumulator = 0.0
+        self.save_previous()
         if not initial:
             self.active_powerup = None
             self.state = "RUNNING"
+            if self.recorder is not None:
+                self.recorder.record(self.sim_steps, REPLAY_RESTART)
 
     def generate_platforms(self):
-        bottom_y = SCREEN_HEIGHT - 150
-        gap = PLATFORM_GAP
         bottom_platform = None
-        prev_x = None
         for i in range(NUM_PLATFORMS):
-            y = bottom_y - i * gap
-            if i == 0:
-                x = random.randint(0, SCREEN_WIDTH - PLATFORM_WIDTH)
-            else:
-                offset = random.randint(-250, 230)
-                x_candidate = prev_x + offset
-                if x_candidate < 0 or x_candidate > SCREEN_WIDTH - PLATFORM_WIDTH:
-                    offset = -offset
-                    x_candidate = prev_x + offset
-                x = x_candidate
-            pf = Platform(x, y, PLATFORM_WIDTH, PLATFORM_HEIGHT,
-                          self.all_sprites, self.platforms)
-            if random.random() < COIN_SPAWN_CHANCE:
-                Coin(pf.rect.centerx, pf.rect.top - 12,
-                     self.all_sprites, self.coins_group)
+            pf = self.spawn_row(self.generator.take())
             if i == 0:
                 bottom_platform = pf
-            prev_x = x
         return bottom_platform
 
     def convert_platforms_below_to_traps(self, y_threshold):
-        to_convert = [p for p in self.platforms if p.rect.y > y_threshold and
-                      not p.is_trap]
+        # трогаем только ряды, оказавшиеся ниже границы с прошлого приземления
+        to_convert = self.world.mark_traps_below(y_threshold)
+        if to_convert:
+            self.full_redraw = True
         for p in to_convert:
             p.become_trap()
+            self.platform_rects.set_trap(p)
             self.trap_platforms.add(p)
             self.platforms.remove(p)
 
@@ -578,7 +1785,7 @@ class Game:
         if self.music_bg:
             pygame.mixer.music.play(-1)
         while self.running:
-            dt = self.clock.tick(FPS)
+            dt = self.clock.tick(self.fps)
             if self.state == "START":
                 self.show_start_screen()
             elif self.state == "HELP":
@@ -588,166 +1795,412 @@ class Game:
             elif self.state == "SHOP":
                 self.show_shop_screen()
             elif self.state == "RUNNING":
+                start = time.perf_counter()
                 self.game_loop(dt)
+                tier = self.governor.observe(
+                    (time.perf_counter() - start) * 1000)
+                if tier is not None:
+                    self.apply_quality(tier)
             elif self.state == "PAUSE":
                 self.show_pause_screen()
             elif self.state == "GAMEOVER":
                 self.show_game_over_screen()
+        if self.generator is not None:
+            self.generator.close()
+        if self.scores is not None:
+            self.scores.close()
         pygame.quit()
 
     def game_loop(self, dt):
-        self.handle_events(dt)
+        self.profiler.begin()
+        self.handle_events()
+        self.profiler.lap("events")
+        self.accumulator += dt
+        steps = 0
+        while (self.accumulator >= SIM_STEP and self.running and
+               self.state == "RUNNING"):
+            if steps == MAX_CATCHUP_STEPS:
+                # не успеваем: лишнее время отбрасываем, игра замедлится,
+                # но физика останется той же
+                self.accumulator %= SIM_STEP
+                break
+            self.simulate(SIM_STEP)
+            self.accumulator -= SIM_STEP
+            steps += 1
+        if self.state != "RUNNING":
+            self.accumulator = 0.0
+            self.profiler.end_frame()
+            return
+        if self.render:
+            self.render_frame(self.accumulator / SIM_STEP)
+        self.profiler.end_frame()
+
+    def apply_quality(self, tier):
+        self.lava_sparks.rate = tier["spark_rate"]
+        self.lava_sparks.set_cap(tier["spark_cap"])
+        self.minimap.set_rate(tier["minimap_hz"])
+        self.text_antialias = tier["antialias"]
+        self.lava.frame_interval = 1000 // tier["lava_fps"]
+        self.full_redraw = True
+        print(f"Качество: {tier['name']} (кадр в среднем "
+              f"{self.governor.mean:.1f} мс при бюджете "
+              f"{self.governor.budget:.1f} мс)")
+
+    def render_frame(self, alpha=1.0):
+        profiler = self.profiler
+        rects = self.draw_game(alpha)
+        if profiler.overlay:
+            overlay_rect = profiler.draw(self.screen, self.get_font(14))
+            if rects is not None:
+                rects.append(overlay_rect)
+        profiler.lap("draw")
+        self.present(rects)
+        profiler.lap("flip")
+
+    def simulate(self, dt):
+        self.sim_steps += 1
+        self.save_previous()
+        profiler = self.profiler
         self.lava.rise(LAVA_RISE_SPEED)
         if self.lava.check_collision(self.player):
-            self.player.kill_player()
+            self.player.kill_player("lava")
+        profiler.lap("lava")
         if self.player.rect.y >= 999999:
             self.state = "GAMEOVER"
             return
         if self.active_powerup:
             self.active_powerup.update(self.player)
         self.lava.update(dt)
-        self.all_sprites.update(dt, self.platforms, self.trap_platforms, self)
-        self.lava_sparks.update(dt)
-        for _ in pygame.sprite.spritecollide(self.player, self.coins_group, True):
+        self.lava_sparks.tick(dt, self.lava.lava_level, SCREEN_WIDTH)
+        self.all_sprites.update(dt, self)
+        self.lava_sparks.update()
+        profiler.lap("sprites")
+        coin_rects = self.coin_rects
+        for slot in coin_rects.colliding(self.player.rect):
+            self.release_coin(coin_rects.sprites[slot])
             self.player.pick_coin()
+            self.full_redraw = True
         if self.player.score >= 100:
             pass
+        profiler.lap("coins")
         self.camera.update(self.player)
         self.recenter_world()
+        profiler.lap("recenter")
         self.update_world()
-        self.minimap.update()
-        self.draw_game()
+        profiler.lap("world")
+        self.minimap.update(dt)
+        profiler.lap("minimap")
 
-    def handle_events(self, dt):
+    def step(self, frames):
+        self.finish_loading()
+        if self.state == "START":
+            self.state = "RUNNING"
+        done = 0
+        while done < frames and self.running and self.state == "RUNNING":
+            self.profiler.begin()
+            self.handle_events()
+            self.profiler.lap("events")
+            self.simulate(SIM_STEP)
+            if self.render and self.state == "RUNNING":
+                self.render_frame()
+            self.profiler.end_frame()
+            done += 1
+        return done
+
+    def play_replay(self, replay):
+        self.finish_loading()
+        self.state = "RUNNING"
+        samples = []
+        while self.running and not replay.finished(self):
+            replay.apply(self)
+            if self.state != "RUNNING":
+                break
+            if self.render:
+                pygame.event.pump()
+            start = time.perf_counter()
+            self.profiler.begin()
+            self.simulate(SIM_STEP)
+            if self.render and self.state == "RUNNING":
+                self.render_frame()
+            self.profiler.end_frame()
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    def buy_powerup(self, name):
+        self.player.coins -= POWERUP_PRICES[name]
+        self.active_powerup = PowerUp(name)
+        self.active_powerup.activate(self.player)
+        AUDIO.play("buy")
+        if self.recorder is not None:
+            self.recorder.record(self.sim_steps, REPLAY_BUY,
+                                 list(POWERUP_PRICES).index(name))
+
+    def save_previous(self):
+        self.previous = (self.camera.dy, self.player.rect.x,
+                         self.player.rect.y, self.lava.rect.top)
+
+    def interpolate(self, alpha):
+        # рисуем положение между двумя последними шагами симуляции
+        cam_dy, px, py, lava_top = self.previous
+        rect = self.player.rect
+        if abs(rect.x - px) > SCREEN_WIDTH // 2:
+            # перенос через край экрана не сглаживаем
+            px = rect.x
+        self.view_dy = round(cam_dy + (self.camera.dy - cam_dy) * alpha)
+        self.player_pos = (round(px + (rect.x - px) * alpha) + self.camera.dx,
+                           round(py + (rect.y - py) * alpha) + self.view_dy)
+        self.lava_top = round(lava_top + (self.lava.rect.top - lava_top) *
+                              alpha) + self.view_dy
+
+    def handle_events(self):
         for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self.running = False
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    self.state = "PAUSE"
-                elif event.key in (pygame.K_UP, pygame.K_w):
-                    if self.player.jump():
-                        self.player.is_jumping = True
-                        self.player.jump_timer = 300
-                elif event.key in (pygame.K_LEFT, pygame.K_a):
-                    self.player.move_left()
-                elif event.key in (pygame.K_RIGHT, pygame.K_d):
-                    self.player.move_right()
-            elif event.type == pygame.KEYUP:
-                if event.key in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_a, pygame.K_d):
-                    self.player.stop_x()
-            elif event.type == pygame.USEREVENT + 1:
-                spark_x = random.randint(0, SCREEN_WIDTH)
-                spark_y = self.lava.lava_level
-                self.all_sprites.add(LavaSpark(spark_x, spark_y, self.lava_sparks))
-
-    def draw_game(self):
-        self.screen.fill(BLACK)
-        for spr in self.all_sprites:
-            self.screen.blit(spr.image, (spr.rect.x + self.camera.dx,
-                                         spr.rect.y + self.camera.dy))
-        for spark in self.lava_sparks:
-            self.screen.blit(spark.image, (spark.rect.x + self.camera.dx,
-                                           spark.rect.y + self.camera.dy))
-        lava_top = self.lava.rect.top + self.camera.dy
-        if lava_top < SCREEN_HEIGHT:
-            lava_frame = self.lava.image
-            frame_h = lava_frame.get_height() or 1
-            y = lava_top
-            while y < SCREEN_HEIGHT:
-                self.screen.blit(lava_frame, (0, y))
-                y += frame_h
-        self.minimap.draw(self.screen)
+            self.handle_event(event)
+
+    def handle_event(self, event):
+        # пауза и профилировщик на симуляцию не влияют, их не записываем
+        if (self.recorder is not None and
+                event.type in (pygame.KEYDOWN, pygame.KEYUP) and
+                event.key not in (pygame.K_ESCAPE, pygame.K_F3)):
+            self.recorder.record(
+                self.sim_steps,
+                REPLAY_KEYDOWN if event.type == pygame.KEYDOWN else REPLAY_KEYUP,
+                event.key)
+        if event.type == pygame.QUIT:
+            self.running = False
+        elif event.type == pygame.VIDEOEXPOSE:
+            self.full_redraw = True
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                self.state = "PAUSE"
+                self.full_redraw = True
+            elif event.key == pygame.K_F3:
+                self.profiler.toggle_overlay()
+                self.full_redraw = True
+            elif event.key in (pygame.K_UP, pygame.K_w):
+                if self.player.jump():
+                    self.player.is_jumping = True
+                    self.player.jump_timer = 300
+            elif event.key in (pygame.K_LEFT, pygame.K_a):
+                self.player.move_left()
+            elif event.key in (pygame.K_RIGHT, pygame.K_d):
+                self.player.move_right()
+        elif event.type == pygame.KEYUP:
+            if event.key in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_a, pygame.K_d):
+                self.player.stop_x()
+
+    def spawn_spark(self, count=1):
+        return self.lava_sparks.emit(count, self.lava.lava_level, SCREEN_WIDTH)
+
+    def visible_sprites(self, top, bottom):
+        sprites = []
+        if self.player.rect.bottom > top and self.player.rect.top < bottom:
+            sprites.append(self.player)
+        for group in (self.platforms, self.trap_platforms, self.coins_group):
+            sprites.extend(group.query(top, bottom))
+        return sprites
+
+    def dynamic_rects(self):
+        dx, dy = self.camera.dx, self.view_dy
+        rects = [pygame.Rect(self.player_pos, self.player.rect.size),
+                 self.minimap.rect.copy()]
+        rects.extend(self.lava_sparks.rects(dx, dy))
+        lava_top = max(0, self.lava_top)
+        rects.append(pygame.Rect(0, lava_top, SCREEN_WIDTH,
+                                 SCREEN_HEIGHT - lava_top))
+        # полупрозрачный оверлей рисуется поверх, под ним нужен свежий кадр
+        if self.profiler.overlay and self.profiler.overlay_rect is not None:
+            rects.append(self.profiler.overlay_rect.copy())
+        return rects
+
+    def compose(self, area=None):
+        dx, dy = self.camera.dx, self.view_dy
+        full = area is None
+        if full:
+            area = self.screen.get_rect()
+            self.screen.fill(BLACK)
+        else:
+            self.screen.set_clip(area)
+            self.screen.fill(BLACK, area)
+        for spr in self.visible_sprites(area.top - dy, area.bottom - dy):
+            if spr is self.player:
+                self.screen.blit(spr.image, self.player_pos)
+            else:
+                self.screen.blit(spr.image, (spr.rect.x + dx, spr.rect.y + dy))
+        self.lava_sparks.draw(self.screen, dx, dy, None if full else area)
+        # лава - тот же спрайт, поэтому отдельно её не рисуем, только заливку
+        if self.lava_top < area.bottom:
+            self.lava.draw_fill(self.screen, self.lava_top)
+        if full or self.minimap.rect.colliderect(area):
+            self.minimap.draw(self.screen)
+        if full or area.collidelist(self.hud_rects) != -1:
+            self.draw_hud()
+        if not full:
+            self.screen.set_clip(None)
+
+    def draw_game(self, alpha=1.0):
         if self.player.score > self.best_score:
             self.best_score = int(self.player.score)
-        self.draw_text(f"Счёт: {int(self.player.score)}", 20, 20, WHITE)
-        self.draw_text(f"Монеты: {self.player.coins}", 20, 50, YELLOW)
+        self.interpolate(alpha)
+        dynamic = self.dynamic_rects()
+        # счёт растёт и без сдвига камеры, а HUD в грязные области не входит
+        powerup = self.active_powerup
+        hud = (int(self.player.score), self.player.coins, self.best_score,
+               self.previous_score,
+               powerup.display_name if powerup and powerup.active else None)
+        if hud != self.last_hud:
+            self.full_redraw = True
+            self.last_hud = hud
+        if (not self.dirty_rendering or self.full_redraw or
+                self.view_dy != self.last_camera_dy):
+            self.compose()
+            rects = None
+        else:
+            # камера стоит: перерисовываем только то, что могло измениться
+            rects = merge_rects(self.prev_dynamic_rects + dynamic)
+            for rect in rects:
+                self.compose(rect)
+        self.prev_dynamic_rects = dynamic
+        self.last_camera_dy = self.view_dy
+        self.full_redraw = False
+        return rects
+
+    def present(self, rects=None):
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+
+    def draw_hud(self):
+        self.hud_rects = [
+            self.draw_value("Счёт: ", int(self.player.score), 20, 20, WHITE),
+            self.draw_value("Монеты: ", self.player.coins, 20, 50, YELLOW)]
         if self.active_powerup and self.active_powerup.active:
-            self.draw_text(f"Усиление: {self.active_powerup.display_name}",
-                           20, 80, CYAN)
+            self.hud_rects.append(self.draw_text(
+                f"Усиление: {self.active_powerup.display_name}", 20, 80, CYAN))
         if self.previous_score is not None:
-            self.draw_text(f"Крайний счёт: {self.previous_score}",
-                           SCREEN_WIDTH - 205, 20, WHITE)
-        self.draw_text(f"Лучший счёт: {self.best_score}",
-                       SCREEN_WIDTH - 205, 50, WHITE)
-        pygame.display.flip()
+            self.hud_rects.append(self.draw_value(
+                "Крайний счёт: ", self.previous_score,
+                SCREEN_WIDTH - 205, 20, WHITE))
+        self.hud_rects.append(self.draw_value(
+            "Лучший счёт: ", self.best_score, SCREEN_WIDTH - 205, 50, WHITE))
 
     def draw_text(self, text, x, y, color=WHITE):
-        img = self.font.render(text, True, color)
-        self.screen.blit(img, (x, y))
+        img = self.text_cache.render(self.font, text, color,
+                                     self.text_antialias)
+        return self.screen.blit(img, (x, y))
+
+    def draw_value(self, label, value, x, y, color=WHITE):
+        # число собираем из закэшированных цифр: счёт меняется почти
+        # каждый кадр, а растеризовать шрифт ради этого незачем
+        rect = self.draw_text(label, x, y, color)
+        for digit in str(value):
+            rect = rect.union(self.draw_text(digit, rect.right, y, color))
+        return rect
+
+    def get_font(self, size, bold=False):
+        key = (size, bold)
+        font = self.fonts.get(key)
+        if font is None:
+            font = self.fonts[key] = pygame.font.SysFont(FONT_NAME, size,
+                                                         bold=bold)
+        return font
+
+    def menu_surface(self, name, content_key, build):
+        # экран меню собирается один раз и пересобирается, только если
+        # изменилось его содержимое (content_key)
+        cached = self.menu_surfaces.get(name)
+        if cached is not None and cached[0] == content_key:
+            return cached[1]
+        surface = build()
+        self.menu_surfaces[name] = (content_key, surface)
+        return surface
+
+    def compose_menu(self, background, lines):
+        surface = ASSETS.image(background, None,
+                               (SCREEN_WIDTH, SCREEN_HEIGHT)).copy()
+        for font, text, color, center in lines:
+            img = font.render(text, True, color)
+            surface.blit(img, img.get_rect(center=center))
+        return surface
+
+    def show_menu(self, surface):
+        self.screen.blit(surface, (0, 0))
+        pygame.display.flip()
+        self.report_startup("first_frame_ms", "Первый кадр")
+
+    def wait_menu_event(self, surface):
+        # меню стоит на месте, поэтому ждём событий, а не крутим кадры
+        while True:
+            if self.loading is not None:
+                # пока игрок смотрит меню, понемногу догружаем игру
+                event = pygame.event.wait(LOADING_POLL_MS)
+                if event.type == pygame.NOEVENT:
+                    self.load_step()
+                    continue
+            else:
+                event = pygame.event.wait()
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                self.show_menu(surface)
+                continue
+            # время в меню не должно попасть в dt первого игрового кадра
+            self.clock.tick()
+            return event
+
+    def build_start_screen(self):
+        title_font = self.get_font(FONT_SIZE + 20, bold=True)
+        command_font = self.get_font(FONT_SIZE + 10, bold=True)
+        return self.compose_menu(START_FON, [
+            (title_font, "ENDLESS LAVA ESCAPE", WHITE,
+             (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 330)),
+            (command_font, "УБЕГИ ОТ ЛАВЫ", WHITE,
+             (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 270)),
+            (command_font, "[H]elp    H[o]w to play   [ENTER] Start", WHITE,
+             (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 80)),
+        ])
 
     def show_start_screen(self):
-        bg = pygame.transform.scale(load_image(START_FON),
-                                    (SCREEN_WIDTH, SCREEN_HEIGHT))
-        title_font = pygame.font.SysFont(FONT_NAME, FONT_SIZE + 20, bold=True)
-        command_font = pygame.font.SysFont(FONT_NAME, FONT_SIZE + 10, bold=True)
-        waiting = True
-        if not pygame.mixer.music.get_busy():
+        surface = self.menu_surface("START", None, self.build_start_screen)
+        if self.music_loaded and not pygame.mixer.music.get_busy():
             pygame.mixer.music.play(-1)
-        while waiting and self.running and self.state == "START":
-            self.clock.tick(FPS)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.running = False
-                    waiting = False
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_RETURN:
-                        pygame.mixer.music.stop()
-                        self.state = "RUNNING"
-                        waiting = False
-                    elif event.key == pygame.K_h:
-                        self.state = "HELP"
-                        waiting = False
-                    elif event.key == pygame.K_o:
-                        self.state = "HOW_TO_PLAY"
-                        waiting = False
-
-            self.screen.blit(bg, (0, 0))
-            title_img = title_font.render("ENDLESS LAVA ESCAPE", True, WHITE)
-            self.screen.blit(title_img, title_img.get_rect(
-                center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 330)))
-            subtitle_img = command_font.render("УБЕГИ ОТ ЛАВЫ", True, WHITE)
-            self.screen.blit(subtitle_img, subtitle_img.get_rect(
-                center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 270)))
-            command_img = command_font.render(
-                "[H]elp    H[o]w to play   [ENTER] Start", True, WHITE)
-            self.screen.blit(command_img, command_img.get_rect(
-                center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 80)))
-            pygame.display.flip()
-
-    def show_help_screen(self):
-        bg = pygame.transform.scale(load_image(HELP_FON),
-                                    (SCREEN_WIDTH, SCREEN_HEIGHT))
-        title_font = pygame.font.SysFont(FONT_NAME, FONT_SIZE + 20, bold=True)
-        text_font = pygame.font.SysFont(FONT_NAME, FONT_SIZE + 10, bold=True)
+        self.show_menu(surface)
+        while self.running and self.state == "START":
+            event = self.wait_menu_event(surface)
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_RETURN:
+                    pygame.mixer.music.stop()
+                    self.finish_loading()
+                    self.state = "RUNNING"
+                elif event.key == pygame.K_h:
+                    self.state = "HELP"
+                elif event.key == pygame.K_o:
+                    self.state = "HOW_TO_PLAY"
+
+    def build_help_screen(self):
+        title_font = self.get_font(FONT_SIZE + 20, bold=True)
+        text_font = self.get_font(FONT_SIZE + 10, bold=True)
         instructions = ["←/→ или A/D – движение", "↑ или W – прыжок",
                         "ESC – Пауза/Выход", "Нажмите любую клавишу, чтобы вернуться..."]
-        waiting = True
-        while waiting and self.running and self.state == "HELP":
-            self.clock.tick(FPS)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.running = False
-                    waiting = False
-                elif event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN):
-                    self.state = "START"
-                    waiting = False
-            self.screen.blit(bg, (0, 0))
-            title_img = title_font.render("Управление", True, WHITE)
-            self.screen.blit(title_img, title_img.get_rect(
-                center=(SCREEN_WIDTH // 2, 180)))
-            start_y = 280
-            for line in instructions:
-                line_img = text_font.render(line, True, WHITE)
-                self.screen.blit(line_img, line_img.get_rect(
-                    center=(SCREEN_WIDTH // 2, start_y)))
-                start_y += 40
-            pygame.display.flip()
+        lines = [(title_font, "Управление", WHITE, (SCREEN_WIDTH // 2, 180))]
+        start_y = 280
+        for line in instructions:
+            lines.append((text_font, line, WHITE, (SCREEN_WIDTH // 2, start_y)))
+            start_y += 40
+        return self.compose_menu(HELP_FON, lines)
 
-    def show_how_to_play_screen(self):
-        bg = pygame.transform.scale(load_image(HELP_FON),
-                                    (SCREEN_WIDTH, SCREEN_HEIGHT))
-        info_font = pygame.font.SysFont(FONT_NAME, FONT_SIZE + 10, bold=True)
+    def show_help_screen(self):
+        surface = self.menu_surface("HELP", None, self.build_help_screen)
+        self.show_menu(surface)
+        while self.running and self.state == "HELP":
+            event = self.wait_menu_event(surface)
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN):
+                self.state = "START"
+
+    def build_how_to_play_screen(self):
+        info_font = self.get_font(FONT_SIZE + 10, bold=True)
         instructions = [
             "КАК ИГРАТЬ:",
             "",
@@ -763,122 +2216,127 @@ class Game:
             "",
             "Нажмите любую клавишу, чтобы вернуться..."
         ]
-        waiting = True
-        while waiting and self.running and self.state == "HOW_TO_PLAY":
-            self.clock.tick(FPS)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.running = False
-                    waiting = False
-                elif event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN):
-                    self.state = "START"
-                    waiting = False
-            self.screen.blit(bg, (0, 0))
-            start_y = 60
-            for line in instructions:
-                line_img = info_font.render(line, True, WHITE)
-                self.screen.blit(line_img, line_img.get_rect(
-                    center=(SCREEN_WIDTH // 2, start_y)))
-                start_y += 40
-            pygame.display.flip()
+        lines = []
+        start_y = 60
+        for line in instructions:
+            lines.append((info_font, line, WHITE, (SCREEN_WIDTH // 2, start_y)))
+            start_y += 40
+        return self.compose_menu(HELP_FON, lines)
+
+    def show_how_to_play_screen(self):
+        surface = self.menu_surface("HOW_TO_PLAY", None,
+                                    self.build_how_to_play_screen)
+        self.show_menu(surface)
+        while self.running and self.state == "HOW_TO_PLAY":
+            event = self.wait_menu_event(surface)
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN):
+                self.state = "START"
+
+    def build_shop_screen(self):
+        shop_font = self.get_font(FONT_SIZE + 5, bold=True)
+        if self.active_powerup is not None and self.active_powerup.name in [
+            "double_jump", "triple_jump", "quadruple_jump"]:
+            line1 = "[1] ДВОЙНОЙ ПРЫЖОК - РАСПРОДАН"
+        else:
+            line1 = "Нажмите [1], чтобы купить ДВОЙНОЙ ПРЫЖОК за 3 монеты"
+        if self.active_powerup is not None and self.active_powerup.name in [
+            "triple_jump", "quadruple_jump"]:
+            line2 = "[2] ТРОЙНОЙ ПРЫЖОК - РАСПРОДАН"
+        else:
+            line2 = "Нажмите [2], чтобы купить ТРОЙНОЙ ПРЫЖОК за 5 монет"
+        if self.active_powerup is not None and self.active_powerup.name == "quadruple_jump":
+            line3 = "[3] ЧЕТВЕРНОЙ ПРЫЖОК - РАСПРОДАН"
+        else:
+            line3 = "Нажмите [3], чтобы купить ЧЕТВЕРНОЙ ПРЫЖОК за 7 монет"
+        return self.compose_menu(SHOP_FON, [
+            (shop_font, line1, WHITE, (SCREEN_WIDTH // 2, 200)),
+            (shop_font, line2, WHITE, (SCREEN_WIDTH // 2, 250)),
+            (shop_font, line3, WHITE, (SCREEN_WIDTH // 2, 300)),
+            (shop_font, "Нажмите любую другую клавишу для выхода...", WHITE,
+             (SCREEN_WIDTH // 2, 400)),
+        ])
 
     def show_shop_screen(self):
-        bg = pygame.transform.scale(load_image(SHOP_FON),
-                                    (SCREEN_WIDTH, SCREEN_HEIGHT))
-        shop_font = pygame.font.SysFont(FONT_NAME, FONT_SIZE + 5, bold=True)
-        waiting = True
-        while waiting and self.running and self.state == "SHOP":
-            self.clock.tick(FPS)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.running = False
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_1:
-                        if (self.active_powerup is None or self.active_powerup.name not in
-                            ["double_jump", "triple_jump", "quadruple_jump"]) and \
-                                self.player.coins >= 3:
-                            self.player.coins -= 3
-                            self.active_powerup = PowerUp("double_jump")
-                            self.active_powerup.activate(self.player)
-                            if self.buy_sound is not None:
-                                self.buy_sound.play()
-                    elif event.key == pygame.K_2:
-                        if (self.active_powerup is None or self.active_powerup.name not in
-                            ["triple_jump", "quadruple_jump"]) and self.player.coins >= 5:
-                            self.player.coins -= 5
-                            self.active_powerup = PowerUp("triple_jump")
-                            self.active_powerup.activate(self.player)
-                            if self.buy_sound is not None:
-                                self.buy_sound.play()
-                    elif event.key == pygame.K_3:
-                        if (self.active_powerup is None or self.active_powerup.name !=
-                            "quadruple_jump") and self.player.coins >= 7:
-                            self.player.coins -= 7
-                            self.active_powerup = PowerUp("quadruple_jump")
-                            self.active_powerup.activate(self.player)
-                            if self.buy_sound is not None:
-                                self.buy_sound.play()
-                    self.state = "PAUSE"
-                    return
-            self.screen.blit(bg, (0, 0))
-            if self.active_powerup is not None and self.active_powerup.name in [
-                "double_jump", "triple_jump", "quadruple_jump"]:
-                line1 = "[1] ДВОЙНОЙ ПРЫЖОК - РАСПРОДАН"
-            else:
-                line1 = "Нажмите [1], чтобы купить ДВОЙНОЙ ПРЫЖОК за 3 монеты"
-            if self.active_powerup is not None and self.active_powerup.name in [
-                "triple_jump", "quadruple_jump"]:
-                line2 = "[2] ТРОЙНОЙ ПРЫЖОК - РАСПРОДАН"
-            else:
-                line2 = "Нажмите [2], чтобы купить ТРОЙНОЙ ПРЫЖОК за 5 монет"
-            if self.active_powerup is not None and self.active_powerup.name == "quadruple_jump":
-                line3 = "[3] ЧЕТВЕРНОЙ ПРЫЖОК - РАСПРОДАН"
-            else:
-                line3 = "Нажмите [3], чтобы купить ЧЕТВЕРНОЙ ПРЫЖОК за 7 монет"
-            line1_img = shop_font.render(line1, True, WHITE)
-            line2_img = shop_font.render(line2, True, WHITE)
-            line3_img = shop_font.render(line3, True, WHITE)
-            self.screen.blit(line1_img, line1_img.get_rect(
-                center=(SCREEN_WIDTH // 2, 200)))
-            self.screen.blit(line2_img, line2_img.get_rect(
-                center=(SCREEN_WIDTH // 2, 250)))
-            self.screen.blit(line3_img, line3_img.get_rect(
-                center=(SCREEN_WIDTH // 2, 300)))
-            exit_img = shop_font.render(
-                "Нажмите любую другую клавишу для выхода...", True, WHITE)
-            self.screen.blit(exit_img, exit_img.get_rect(
-                center=(SCREEN_WIDTH // 2, 400)))
-            pygame.display.flip()
+        sold_out = self.active_powerup.name if self.active_powerup else None
+        surface = self.menu_surface("SHOP", sold_out, self.build_shop_screen)
+        self.show_menu(surface)
+        while self.running and self.state == "SHOP":
+            event = self.wait_menu_event(surface)
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_1:
+                    if (self.active_powerup is None or self.active_powerup.name not in
+                        ["double_jump", "triple_jump", "quadruple_jump"]) and \
+                            self.player.coins >= 3:
+                        self.buy_powerup("double_jump")
+                elif event.key == pygame.K_2:
+                    if (self.active_powerup is None or self.active_powerup.name not in
+                        ["triple_jump", "quadruple_jump"]) and self.player.coins >= 5:
+                        self.buy_powerup("triple_jump")
+                elif event.key == pygame.K_3:
+                    if (self.active_powerup is None or self.active_powerup.name !=
+                        "quadruple_jump") and self.player.coins >= 7:
+                        self.buy_powerup("quadruple_jump")
+                self.state = "PAUSE"
+                return
+
+    def build_pause_screen(self):
+        pause_font = self.get_font(FONT_SIZE + 10, bold=True)
+        return self.compose_menu(PAUSE_FON, [
+            (pause_font, "[ENTER] - ПРОДОЛЖИТЬ", WHITE,
+             (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 330)),
+            (pause_font, "[S] - МАГАЗИН    [ESC] - ВЫХОД", WHITE,
+             (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 270)),
+        ])
 
     def show_pause_screen(self):
-        bg = pygame.transform.scale(load_image(PAUSE_FON),
-                                    (SCREEN_WIDTH, SCREEN_HEIGHT))
-        pause_font = pygame.font.SysFont(FONT_NAME, FONT_SIZE + 10, bold=True)
-        waiting = True
-        while waiting and self.running and self.state == "PAUSE":
-            self.clock.tick(FPS)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
+        surface = self.menu_surface("PAUSE", None, self.build_pause_screen)
+        self.show_menu(surface)
+        while self.running and self.state == "PAUSE":
+            event = self.wait_menu_event(surface)
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_RETURN:
+                    self.state = "RUNNING"
+                    return
+                if event.key == pygame.K_s:
+                    self.state = "SHOP"
+                    return
+                if event.key == pygame.K_ESCAPE:
                     self.running = False
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_RETURN:
-                        self.state = "RUNNING"
-                        return
-                    if event.key == pygame.K_s:
-                        self.state = "SHOP"
-                        return
-                    if event.key == pygame.K_ESCAPE:
-                        self.running = False
-                        waiting = False
-            self.screen.blit(bg, (0, 0))
-            line1_img = pause_font.render("[ENTER] - ПРОДОЛЖИТЬ", True, WHITE)
-            line2_img = pause_font.render("[S] - МАГАЗИН    [ESC] - ВЫХОД",
-                                          True, WHITE)
-            self.screen.blit(line1_img, line1_img.get_rect(
-                center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 330)))
-            self.screen.blit(line2_img, line2_img.get_rect(
-                center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT - 270)))
-            pygame.display.flip()
+
+    def build_game_over_screen(self, new_record, stats):
+        title_font = self.get_font(FONT_SIZE + 20, bold=True)
+        info_font = self.get_font(FONT_SIZE + 10, bold=True)
+        center_x = SCREEN_WIDTH // 2
+        bonus_text = "БОНУС: " + (
+            self.active_powerup.display_name if self.active_powerup is not None and hasattr(self.active_powerup,
+                                                                                            "display_name") else "НЕТ")
+        lines = [
+            (title_font, "Игра окончена!", RED, (center_x, SCREEN_HEIGHT - 450)),
+            (info_font, f"Ваш счёт: {int(self.player.score)}", WHITE,
+             (center_x, SCREEN_HEIGHT - 350)),
+            (info_font, f"Монеты: {self.player.coins}", YELLOW,
+             (center_x, SCREEN_HEIGHT - 300)),
+        ]
+        if new_record:
+            lines.append((info_font, new_record, CYAN,
+                          (center_x, SCREEN_HEIGHT - 500)))
+        lines += [
+            (info_font, f"Количество прыжков: {self.player.total_jumps}", WHITE,
+             (center_x, SCREEN_HEIGHT - 250)),
+            (info_font, f"Забегов: {stats['runs']}, средний счёт: "
+                        f"{stats['mean_score']:.0f}", WHITE,
+             (center_x, SCREEN_HEIGHT - 200)),
+            (info_font, bonus_text, CYAN, (center_x, SCREEN_HEIGHT - 150)),
+            (info_font, "[ENTER] To restart    [ESC] To exit", WHITE,
+             (center_x, SCREEN_HEIGHT - 50)),
+        ]
+        return self.compose_menu(START_FON, lines)
 
     def show_game_over_screen(self):
         self.previous_score = int(self.player.score)
@@ -886,61 +2344,103 @@ class Game:
         if self.player.score >= self.best_score:
             self.best_score = int(self.player.score)
             new_record = "Новый рекорд!"
-        bg = pygame.transform.scale(load_image(START_FON),
-                                    (SCREEN_WIDTH, SCREEN_HEIGHT))
-        self.screen.blit(bg, (0, 0))
-        title_font = pygame.font.SysFont(FONT_NAME, FONT_SIZE + 20, bold=True)
-        info_font = pygame.font.SysFont(FONT_NAME, FONT_SIZE + 10, bold=True)
-        center_x = SCREEN_WIDTH // 2
-        game_over_img = title_font.render("Игра окончена!", True, RED)
-        self.screen.blit(game_over_img, game_over_img.get_rect(
-            center=(center_x, SCREEN_HEIGHT - 450)))
-        score_img = info_font.render(f"Ваш счёт: {int(self.player.score)}",
-                                     True, WHITE)
-        self.screen.blit(score_img, score_img.get_rect(
-            center=(center_x, SCREEN_HEIGHT - 350)))
-        coins_img = info_font.render(f"Монеты: {self.player.coins}", True, YELLOW)
-        self.screen.blit(coins_img, coins_img.get_rect(
-            center=(center_x, SCREEN_HEIGHT - 300)))
-        if new_record:
-            new_record_img = info_font.render(new_record, True, CYAN)
-            self.screen.blit(new_record_img, new_record_img.get_rect(
-                center=(center_x, SCREEN_HEIGHT - 500)))
-        jumps_img = info_font.render(
-            f"Количество прыжков: {self.player.total_jumps}", True, WHITE)
-        self.screen.blit(jumps_img, jumps_img.get_rect(
-            center=(center_x, SCREEN_HEIGHT - 250)))
-        bonus_text = "БОНУС: " + (
-            self.active_powerup.display_name if self.active_powerup is not None and hasattr(self.active_powerup,
-                                                                                            "display_name") else "НЕТ")
-        bonus_img = info_font.render(bonus_text, True, CYAN)
-        self.screen.blit(bonus_img, bonus_img.get_rect(
-            center=(center_x, SCREEN_HEIGHT - 150)))
-        command_img = info_font.render("[ENTER] To restart    [ESC] To exit",
-                                       True, WHITE)
-        self.screen.blit(command_img, command_img.get_rect(
-            center=(center_x, SCREEN_HEIGHT - 50)))
-        pygame.display.flip()
-        waiting = True
-        while waiting and self.running and self.state == "GAMEOVER":
-            self.clock.tick(FPS)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
+        self.scores.add_run(self.previous_score, self.player.coins,
+                            self.player.total_jumps,
+                            getattr(self.active_powerup, "name", None),
+                            self.seed)
+        stats = self.scores.stats()
+        content = (self.previous_score, self.player.coins,
+                   self.player.total_jumps, new_record,
+                   getattr(self.active_powerup, "display_name", None),
+                   stats["runs"], int(stats["mean_score"]))
+        surface = self.menu_surface(
+            "GAMEOVER", content,
+            lambda: self.build_game_over_screen(new_record, stats))
+        self.show_menu(surface)
+        while self.running and self.state == "GAMEOVER":
+            event = self.wait_menu_event(surface)
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_RETURN:
+                    self.reset_game(initial=False)
+                    return
+                if event.key == pygame.K_ESCAPE:
                     self.running = False
-                    waiting = False
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_RETURN:
-                        self.reset_game(initial=False)
-                        waiting = False
-                        return
-                    if event.key == pygame.K_ESCAPE:
-                        self.running = False
-                        waiting = False
 
 
 def main():
-    game = Game()
-    game.run()
+    parser = argparse.ArgumentParser(description=GAME_TITLE)
+    parser.add_argument("--headless", action="store_true",
+                        help="без окна и звука (драйверы SDL dummy)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="зерно генератора случайных чисел")
+    parser.add_argument("--frames", type=int, default=None,
+                        help="прогнать N кадров симуляции как можно быстрее")
+    parser.add_argument("--no-render", action="store_true",
+                        help="не отрисовывать кадры")
+    parser.add_argument("--fps", type=int, default=FPS,
+                        help="частота отрисовки, на физику не влияет")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="перерисовывать только изменившиеся области, "
+                             "пока камера неподвижна")
+    parser.add_argument("--record", metavar="FILE",
+                        help="записать ввод игрока в файл")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="воспроизвести запись как можно быстрее")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="замерять фазы кадра и при выходе сохранить "
+                             "их в CSV или JSON (по расширению); "
+                             "F3 - таблица поверх игры")
+    args = parser.parse_args()
+    replay = None
+    seed = args.seed
+    if args.replay:
+        replay = Replay(args.replay)
+        seed = replay.seed
+    game = Game(headless=args.headless, seed=seed,
+                render=not args.no_render, dirty_rects=args.dirty_rects,
+                fps=args.fps)
+    if args.record:
+        game.recorder = Recorder(args.record, game.seed)
+    if args.profile:
+        game.profiler.export_path = args.profile
+        game.profiler.enabled = True
+    try:
+        if replay is not None:
+            records = len(replay)
+            start = time.perf_counter()
+            samples = sorted(game.play_replay(replay))
+            elapsed = time.perf_counter() - start
+            p50 = samples[len(samples) // 2] if samples else 0.0
+            p99 = samples[len(samples) * 99 // 100] if samples else 0.0
+            print(f"Запись: {records} событий, шагов: {len(samples)}, "
+                  f"время: {elapsed:.3f} с, "
+                  f"{len(samples) / max(elapsed, 1e-9):.0f} шагов/с, "
+                  f"p50: {p50 * 1000:.3f} мс, p99: {p99 * 1000:.3f} мс, "
+                  f"счёт: {int(game.player.score)}, seed: {game.seed}")
+        elif args.frames is None:
+            game.run()
+        else:
+            start = time.perf_counter()
+            done = game.step(args.frames)
+            elapsed = time.perf_counter() - start
+            print(f"Кадров: {done}, время: {elapsed:.3f} с, "
+                  f"{done / max(elapsed, 1e-9):.0f} кадров/с, "
+                  f"счёт: {int(game.player.score)}, seed: {game.seed}")
+    finally:
+        if game.recorder is not None:
+            game.recorder.close(game.sim_steps)
+            print(f"Записано событий: {game.recorder.count} в '{args.record}'")
+        if game.profiler.export_path:
+            game.profiler.export(game.profiler.export_path)
+            print(f"Профиль {game.profiler.count} кадров сохранён в "
+                  f"'{game.profiler.export_path}'")
+        if game.generator is not None:
+            game.generator.close()
+        if game.scores is not None:
+            game.scores.close()
+        pygame.quit()
 
 
 if __name__ == "__main__":